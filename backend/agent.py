@@ -2,54 +2,37 @@
 TapQuote LangChain Agent
 Handles AI-powered quote generation with material retrieval and calculation
 """
+import hashlib
 import json
+import time
 from typing import Optional
 from pydantic import BaseModel, Field
 from langchain_openai import ChatOpenAI
 from langchain_core.prompts import ChatPromptTemplate
 
-from config import OPENAI_API_KEY, OPENAI_MODEL, LABOR_RATE, MATERIAL_MARKUP
-from materials import search_materials, get_all_materials
+from config import OPENAI_API_KEY, OPENAI_MODEL, STRUCTURED_OUTPUT, SEMANTIC_RETRIEVAL
+from estimator import LaborEstimator, fixed_hours_context, sync_estimator
+from ledger import extract_usage, record_usage
+from models import LLMQuote, LLMQuoteItem, Quote, QuoteItem
+from materials import CatalogSnapshot, search_materials, get_catalog
+from quote_parser import QuoteParseError, parse_quote_payload, parse_stats
+from semantic import hybrid_search
+from tenants import TenantConfig, get_tenant_config
 
 
-# Pydantic models for structured output
-class QuoteItem(BaseModel):
-    description: str = Field(description="Description of the work item")
-    qty: int = Field(description="Quantity of items", default=1)
-    unit_material_cost: float = Field(description="Cost per unit after markup")
-    estimated_hours: float = Field(description="Estimated labor hours")
-    labor_cost: float = Field(description="Labor cost (hours * rate)")
-    line_total: float = Field(description="Total for this line item")
-    is_estimate: bool = Field(description="True if price is estimated (not from database)", default=False)
-
-
-class Quote(BaseModel):
-    customer_name: str = Field(description="Customer name", default="Customer")
-    job_summary: str = Field(description="Brief summary of the job")
-    items: list[QuoteItem] = Field(description="List of quote line items")
-    subtotal: float = Field(description="Subtotal before tax")
-    tax: float = Field(description="Tax amount (GST)")
-    grand_total: float = Field(description="Grand total including tax")
-
-
-def retrieve_materials(job_description: str) -> str:
-    """
-    Search materials database and return formatted string for LLM context.
-    This is the 'Retriever' component of the RAG pattern.
-    """
-    # Extract key terms and search
-    materials_found = []
-    
-    # Get all materials for reference
-    all_materials = get_all_materials()
+def find_materials(job_description: str, catalog: CatalogSnapshot | None = None) -> list[dict]:
+    """Return the top catalog matches for a job description."""
+    if SEMANTIC_RETRIEVAL:
+        # Keyword + n-gram embedding fusion catches misspelt and run-together words ("powerpoint" -> GPO)
+        return hybrid_search(job_description, catalog or get_catalog(), limit=10)
     
     # Search based on job description
-    search_results = search_materials(job_description)
-    
-    if search_results:
-        materials_found = search_results[:10]  # Top 10 matches
-    
-    # Format for LLM
+    search_results = search_materials(job_description, catalog)
+    return search_results[:10]  # Top 10 matches
+
+
+def format_materials_context(materials_found: list[dict]) -> str:
+    """Format retrieved materials for the LLM prompt."""
     if not materials_found:
         return "No exact matches found in database. Use realistic market estimates and flag as estimates."
     
@@ -60,17 +43,27 @@ def retrieve_materials(job_description: str) -> str:
     return formatted
 
 
-def calculate_pricing(base_cost: float, quantity: int, labor_hours: float) -> dict:
+def retrieve_materials(job_description: str, catalog: CatalogSnapshot | None = None) -> str:
+    """
+    Search materials database and return formatted string for LLM context.
+    This is the 'Retriever' component of the RAG pattern.
+    """
+    return format_materials_context(find_materials(job_description, catalog))
+
+
+def calculate_pricing(base_cost: float, quantity: int, labor_hours: float, tenant: TenantConfig | None = None) -> dict:
     """
     Apply markup and labor rate to calculate final pricing.
     This is the 'Calculator' component.
     """
+    tenant = tenant or get_tenant_config()
+    
     # Apply markup to materials
-    material_with_markup = base_cost * (1 + MATERIAL_MARKUP / 100)
+    material_with_markup = base_cost * (1 + tenant.material_markup / 100)
     material_total = material_with_markup * quantity
     
     # Calculate labor
-    labor_cost = labor_hours * LABOR_RATE
+    labor_cost = labor_hours * tenant.labor_rate
     
     # Line total
     line_total = material_total + labor_cost
@@ -83,16 +76,83 @@ def calculate_pricing(base_cost: float, quantity: int, labor_hours: float) -> di
     }
 
 
-async def generate_quote(job_description: str, customer_name: str = "Customer") -> dict:
+def apply_fixed_hours(quote: Quote, fixed_hours: dict[str, float], estimator: LaborEstimator, tenant: TenantConfig) -> Quote:
+    """
+    Settle labor hours for every item and record where they came from.
+    SKUs with fixed hours always get them, whatever the LLM sent; other
+    items keep the LLM's estimate, or fall back to the estimator's learned
+    or typical hours when it omitted one. Labor, line and quote totals are
+    then recomputed from the hours, so omitted or stale LLM totals never
+    reach the quote.
+    """
+    for item in quote.items:
+        per_unit = fixed_hours.get(item.sku) if item.sku else None
+        if per_unit is not None:
+            item.hours_source = "fixed"
+        elif item.estimated_hours is not None:
+            item.hours_source = "llm"
+        else:
+            per_unit = estimator.hours_per_unit(item.sku, item.description)
+            item.hours_source = "fixed"
+            if per_unit is None:
+                # Typical hours for the task type, else one hour per unit
+                per_unit = estimator.hours_or_default(item.sku, item.description) or 1.0
+                item.hours_source = "default"
+        
+        if per_unit is not None:
+            item.estimated_hours = round(per_unit * item.qty, 2)
+        item.labor_cost = round(item.estimated_hours * tenant.labor_rate, 2)
+        item.line_total = round(item.unit_material_cost * item.qty + item.labor_cost, 2)
+    
+    return recompute_totals(quote, tenant)
+
+
+def recompute_totals(quote: Quote, tenant: TenantConfig) -> Quote:
+    """Recompute subtotal, tax and grand total from the line items."""
+    quote.subtotal = round(sum(item.line_total for item in quote.items), 2)
+    quote.tax = round(quote.subtotal * tenant.tax_rate / 100, 2)
+    quote.grand_total = round(quote.subtotal + quote.tax, 2)
+    return quote
+
+
+def quote_cache_key(job_description: str, customer_name: str, tenant: TenantConfig, catalog_version: int, model: str) -> str:
+    """
+    Shared cache key for an LLM quote: the same job for the same customer,
+    priced under the same tenant config (by content) and catalog version by
+    the same model.
+    """
+    job = " ".join(job_description.lower().split())
+    digest = hashlib.blake2b(f"{customer_name}\n{job}".encode("utf-8"), digest_size=16).hexdigest()
+    return f"{tenant.tenant_id}:{tenant.fingerprint}:c{catalog_version}:{model}:{digest}"
+
+
+async def generate_quote(
+    job_description: str,
+    customer_name: str = "Customer",
+    tenant: TenantConfig | None = None,
+    model: str | None = None,
+    endpoint: str = "/generate-quote",
+    catalog: CatalogSnapshot | None = None
+) -> Quote:
     """
     Main quote generation function using LangChain.
+    Token usage for the call is recorded in the ledger against the tenant and endpoint.
+    Pass catalog to price against a snapshot the caller already holds.
     """
-    # Step 1: Retrieve relevant materials
-    materials_context = retrieve_materials(job_description)
+    tenant = tenant or get_tenant_config()
+    
+    # Step 1: Retrieve relevant materials (pinned to one catalog version)
+    catalog = catalog or get_catalog()
+    materials_found = find_materials(job_description, catalog)
+    materials_context = format_materials_context(materials_found)
+    
+    # Known labor hours are fixed inputs, not something the LLM estimates
+    estimator = sync_estimator()
+    fixed_hours_block, fixed_hours = fixed_hours_context(materials_found, estimator)
     
     # Step 2: Create LLM chain
     llm = ChatOpenAI(
-        model=OPENAI_MODEL,
+        model=model or OPENAI_MODEL,
         api_key=OPENAI_API_KEY,
         temperature=0.2
     )
@@ -105,28 +165,34 @@ Configuration:
 - Material Markup: {markup}%
 
 {materials_context}
-
+{fixed_hours_block}
 Your task is to analyze the job description and create a detailed quote.
 
 Instructions:
 1. Break the job into distinct line items (each task/installation is a separate item)
 2. For each item, identify the materials needed from the database
 3. If a material is not in the database, use a realistic market estimate and set is_estimate to true
-4. Estimate reasonable labor hours for each task (typical: GPO install 0.5hr, downlight 0.75hr, circuit run 2-3hr)
+4. Set sku to the catalog SKU of the item's main material (null if not from the database).
+   For items whose SKU has fixed labor hours, omit estimated_hours, labor_cost and line_total - they are calculated for you.
+   For all other items, estimate reasonable labor hours (typical: GPO install 0.5hr, downlight 0.75hr, circuit run 2-3hr)
 5. Calculate costs using:
    - unit_material_cost = base_cost * (1 + markup/100)
    - labor_cost = estimated_hours * labor_rate
    - line_total = (unit_material_cost * qty) + labor_cost
 6. Calculate totals:
    - subtotal = sum of all line_totals
-   - tax = subtotal * 0.10 (10% GST)
+   - tax = subtotal * {tax_fraction} ({tax_rate}% GST)
    - grand_total = subtotal + tax
 
 Return a valid JSON object matching the schema exactly."""
 
     user_prompt = """Job Description: {job_description}
 
-Customer Name: {customer_name}
+Customer Name: {customer_name}"""
+
+    if not STRUCTURED_OUTPUT:
+        # Free-form mode spells the schema out in the prompt
+        user_prompt += """
 
 Generate a complete quote as JSON with this exact structure:
 {{
@@ -135,6 +201,7 @@ Generate a complete quote as JSON with this exact structure:
     "items": [
         {{
             "description": "string",
+            "sku": "string or null",
             "qty": number,
             "unit_material_cost": number,
             "estimated_hours": number,
@@ -155,44 +222,151 @@ Generate a complete quote as JSON with this exact structure:
     
     # Format the prompt
     formatted_prompt = prompt.format_messages(
-        labor_rate=LABOR_RATE,
-        markup=MATERIAL_MARKUP,
+        labor_rate=tenant.labor_rate,
+        markup=tenant.material_markup,
+        tax_rate=tenant.tax_rate,
+        tax_fraction=tenant.tax_rate / 100,
         materials_context=materials_context,
+        fixed_hours_block=fixed_hours_block,
         job_description=job_description,
         customer_name=customer_name
     )
     
-    # Step 3: Get LLM response
-    response = await llm.ainvoke(formatted_prompt)
+    # Step 3: Get LLM response (schema-constrained via tool calling when enabled)
+    started = time.perf_counter()
+    if STRUCTURED_OUTPUT:
+        result = await llm.with_structured_output(LLMQuote, method="function_calling", include_raw=True).ainvoke(formatted_prompt)
+        response = result["raw"]
+    else:
+        result = None
+        response = await llm.ainvoke(formatted_prompt)
+    record_usage(
+        tenant_id=tenant.tenant_id,
+        endpoint=endpoint,
+        stage="quote",
+        model=model or OPENAI_MODEL,
+        latency_ms=(time.perf_counter() - started) * 1000,
+        **extract_usage(response)
+    )
+    
+    # Step 4: Parse and validate, repairing locally before paying for another call
+    if result is not None and result.get("parsed") is not None and result["parsed"].items:
+        quote = Quote.from_llm(result["parsed"])
+        parse_stats.record("clean")
+    else:
+        quote = await _recover_quote(
+            llm, response, job_description, customer_name, tenant, model, endpoint
+        )
     
-    # Step 4: Parse JSON from response
+    quote.catalog_version = catalog.version
+    return apply_fixed_hours(quote, fixed_hours, estimator, tenant)
+
+
+class ItemRepair(BaseModel):
+    items: list[LLMQuoteItem] = Field(description="Corrected line items, in the order given")
+
+
+def _response_payload(response) -> dict | str:
+    """The quote payload from a tool call (parsed or raw args) or the message text."""
+    if getattr(response, "tool_calls", None):
+        return response.tool_calls[0]["args"]
+    if getattr(response, "invalid_tool_calls", None):
+        return response.invalid_tool_calls[0].get("args") or ""
+    return response.content
+
+
+async def _recover_quote(
+    llm,
+    response,
+    job_description: str,
+    customer_name: str,
+    tenant: TenantConfig,
+    model: str | None,
+    endpoint: str
+) -> Quote:
+    """
+    Build a Quote from output that didn't validate cleanly. Broken JSON is
+    repaired locally; only line items that still fail validation are sent
+    back to the LLM, and totals are recomputed here.
+    """
+    payload = _response_payload(response)
     try:
-        # Clean the response - extract JSON
-        content = response.content
-        
-        # Find JSON in response
-        start_idx = content.find('{')
-        end_idx = content.rfind('}') + 1
+        parsed = parse_quote_payload(payload)
+    except QuoteParseError:
+        parse_stats.record("failed")
+        raise
+    
+    # In structured mode, getting here already means the tool call didn't validate
+    outcome = "repaired_locally" if parsed.repaired or STRUCTURED_OUTPUT else "clean"
+    if parsed.failed:
+        outcome = "item_retry"
+        fix_prompt = (
+            "These quote line items failed validation. Return corrected items in the same order.\n"
+            f"Labor rate: ${tenant.labor_rate}/hour. Material markup: {tenant.material_markup}%.\n"
+            + json.dumps([{"item": raw_item, "error": error} for _, raw_item, error in parsed.failed], default=str)
+        )
+        started = time.perf_counter()
+        result = await llm.with_structured_output(ItemRepair, method="function_calling", include_raw=True).ainvoke(fix_prompt)
+        record_usage(
+            tenant_id=tenant.tenant_id,
+            endpoint=endpoint,
+            stage="item_repair",
+            model=model or OPENAI_MODEL,
+            latency_ms=(time.perf_counter() - started) * 1000,
+            **extract_usage(result["raw"])
+        )
         
-        if start_idx != -1 and end_idx > start_idx:
-            json_str = content[start_idx:end_idx]
-            quote_data = json.loads(json_str)
-            return quote_data
-        else:
-            raise ValueError("No JSON found in response")
-            
-    except json.JSONDecodeError as e:
-        # Return error structure
-        return {
-            "error": f"Failed to parse quote: {str(e)}",
-            "raw_response": response.content
-        }
+        fixed = result.get("parsed")
+        if fixed is None or len(fixed.items) != len(parsed.failed):
+            parse_stats.record("failed")
+            raise QuoteParseError("Failed to parse quote: line item repair failed", str(payload))
+        for (index, _, _), item in zip(parsed.failed, fixed.items):
+            parsed.items[index] = QuoteItem.from_llm(item)
+    
+    # Lines cut short: recalculate labor and totals from what we have
+    for index in parsed.incomplete:
+        item = parsed.items[index]
+        if item.estimated_hours is not None:
+            item.labor_cost = round(item.estimated_hours * tenant.labor_rate, 2)
+            item.line_total = round(item.unit_material_cost * item.qty + item.labor_cost, 2)
+    
+    data = parsed.data
+    quote = Quote(
+        customer_name=data.get("customer_name") or customer_name,
+        job_summary=data.get("job_summary") or job_description[:100],
+        items=parsed.items,
+        subtotal=0.0,
+        tax=0.0,
+        grand_total=0.0
+    )
+    parse_stats.record(outcome)
+    return recompute_totals(quote, tenant)
+
+
+def _catalog_cost(catalog: CatalogSnapshot, sku: str, fallback: float) -> tuple[float, bool]:
+    """Base cost for a SKU from the snapshot; (fallback, True) if it is no longer listed."""
+    for material in catalog.materials:
+        if material["sku"] == sku:
+            return material["base_cost"], False
+    return fallback, True
 
 
-def generate_mock_quote(job_description: str, customer_name: str = "Customer") -> dict:
+def generate_mock_quote(
+    job_description: str,
+    customer_name: str = "Customer",
+    tenant: TenantConfig | None = None,
+    catalog: CatalogSnapshot | None = None
+) -> Quote:
     """
     Generate a mock quote for testing without OpenAI API.
+    Materials are priced from the given catalog snapshot, so the quote's
+    catalog_version matches the prices on it.
     """
+    tenant = tenant or get_tenant_config()
+    catalog = catalog or get_catalog()
+    markup_factor = 1 + tenant.material_markup / 100
+    estimator = sync_estimator()
+    
     # Simple parsing for demo
     items = []
     
@@ -206,38 +380,51 @@ def generate_mock_quote(job_description: str, customer_name: str = "Customer") -
                 qty = int(word)
                 break
         
-        pricing = calculate_pricing(25.00, qty, 0.75 * qty)
+        learned = estimator.hours_per_unit("LED-DL-10W", "downlight")
+        hours = learned or 0.75
+        base_cost, estimated = _catalog_cost(catalog, "LED-DL-10W", 25.00)
+        pricing = calculate_pricing(base_cost, qty, hours * qty, tenant)
         items.append({
             "description": f"LED Downlight 10W installation (supply & fit)",
+            "sku": "LED-DL-10W",
             "qty": qty,
-            "unit_material_cost": 30.00,  # After 20% markup
-            "estimated_hours": 0.75 * qty,
+            "unit_material_cost": pricing["unit_cost_with_markup"],
+            "estimated_hours": hours * qty,
             "labor_cost": pricing["labor_cost"],
             "line_total": pricing["line_total"],
-            "is_estimate": False
+            "is_estimate": estimated,
+            "hours_source": "fixed" if learned else "default"
         })
     
     if "gpo" in desc_lower or "outlet" in desc_lower or "power point" in desc_lower:
-        pricing = calculate_pricing(12.50, 1, 0.5)
+        learned = estimator.hours_per_unit("CL-GPO-10A", "gpo")
+        hours = learned or 0.5
+        base_cost, estimated = _catalog_cost(catalog, "CL-GPO-10A", 12.50)
+        pricing = calculate_pricing(base_cost, 1, hours, tenant)
         items.append({
             "description": "Clipsal Double GPO 10A installation",
+            "sku": "CL-GPO-10A",
             "qty": 1,
-            "unit_material_cost": 15.00,  # After 20% markup
-            "estimated_hours": 0.5,
+            "unit_material_cost": pricing["unit_cost_with_markup"],
+            "estimated_hours": hours,
             "labor_cost": pricing["labor_cost"],
             "line_total": pricing["line_total"],
-            "is_estimate": False
+            "is_estimate": estimated,
+            "hours_source": "fixed" if learned else "default"
         })
     
     if "circuit" in desc_lower or "20a" in desc_lower or "pool" in desc_lower:
-        # Pool pump circuit
-        pricing_breaker = calculate_pricing(18.00, 1, 0.25)
-        pricing_cable = calculate_pricing(5.50, 15, 1.5)  # 15m of 4mm cable
-        pricing_isolator = calculate_pricing(45.00, 1, 0.5)
+        # Pool pump circuit: breaker, 15m of 4mm cable and an isolator
+        parts = [("CB-20A", 1, 18.00), ("CAB-4-TE", 15, 5.50), ("ISO-POOL", 1, 45.00)]
+        total_material = 0.0
+        estimated = False
+        for sku, qty, fallback in parts:
+            base_cost, part_estimated = _catalog_cost(catalog, sku, fallback)
+            total_material += base_cost * qty * markup_factor
+            estimated = estimated or part_estimated
         
         total_labor = 2.5  # hours
-        total_material = (18.00 * 1.2) + (5.50 * 15 * 1.2) + (45.00 * 1.2)
-        labor_cost = total_labor * LABOR_RATE
+        labor_cost = total_labor * tenant.labor_rate
         
         items.append({
             "description": "20A Circuit for pool pump (inc. breaker, 4mm cable 15m, isolator)",
@@ -246,7 +433,8 @@ def generate_mock_quote(job_description: str, customer_name: str = "Customer") -
             "estimated_hours": total_labor,
             "labor_cost": labor_cost,
             "line_total": round(total_material + labor_cost, 2),
-            "is_estimate": False
+            "is_estimate": estimated,
+            "hours_source": "default"
         })
     
     # If no items detected, add a generic one
@@ -256,21 +444,23 @@ def generate_mock_quote(job_description: str, customer_name: str = "Customer") -
             "qty": 1,
             "unit_material_cost": 50.00,
             "estimated_hours": 1.0,
-            "labor_cost": LABOR_RATE,
-            "line_total": 50.00 + LABOR_RATE,
-            "is_estimate": True
+            "labor_cost": tenant.labor_rate,
+            "line_total": 50.00 + tenant.labor_rate,
+            "is_estimate": True,
+            "hours_source": "default"
         })
     
     # Calculate totals
     subtotal = sum(item["line_total"] for item in items)
-    tax = round(subtotal * 0.10, 2)
+    tax = round(subtotal * tenant.tax_rate / 100, 2)
     grand_total = round(subtotal + tax, 2)
     
-    return {
+    return Quote.model_validate({
         "customer_name": customer_name,
         "job_summary": job_description[:100] + "..." if len(job_description) > 100 else job_description,
         "items": items,
         "subtotal": round(subtotal, 2),
         "tax": tax,
-        "grand_total": grand_total
-    }
+        "grand_total": grand_total,
+        "catalog_version": catalog.version
+    })
@@ -0,0 +1,116 @@
+"""
+TapQuote Serialization Benchmark
+Measures per-request validation/serialization overhead for large quotes.
+
+Usage: python bench_serialization.py [items] [iterations]
+"""
+import json
+import sys
+import time
+
+import orjson
+from fastapi.encoders import jsonable_encoder
+from fastapi.routing import APIRoute
+from pydantic import BaseModel
+
+from main import QuoteResponse
+from models import Quote
+
+
+class OldQuoteResponse(BaseModel):
+    """/generate-quote's response model before quotes were typed."""
+    success: bool
+    quote: dict | None = None
+    error: str | None = None
+
+
+async def _old_endpoint():
+    pass
+
+
+def old_response_field():
+    """The response field FastAPI built for the old response_model=QuoteResponse route."""
+    return APIRoute("/generate-quote", _old_endpoint, methods=["POST"], response_model=OldQuoteResponse).response_field
+
+
+def build_quote(n_items: int) -> dict:
+    """Build a quote dict with n_items line items."""
+    items = [
+        {
+            "description": f"Line item {i}: supply and install LED downlight in room {i % 12}",
+            "qty": 1 + i % 6,
+            "unit_material_cost": 30.0 + i % 7,
+            "estimated_hours": 0.75,
+            "labor_cost": 63.75,
+            "line_total": 93.75 + i % 7,
+            "is_estimate": i % 5 == 0
+        }
+        for i in range(n_items)
+    ]
+    subtotal = round(sum(item["line_total"] for item in items), 2)
+    return {
+        "customer_name": "Benchmark Customer",
+        "job_summary": "Large renovation",
+        "items": items,
+        "subtotal": subtotal,
+        "tax": round(subtotal * 0.1, 2),
+        "grand_total": round(subtotal * 1.1, 2),
+        "catalog_version": 1
+    }
+
+
+def timed(label: str, fn, iterations: int) -> float:
+    fn()  # warm up
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    per_call_us = (time.perf_counter() - start) / iterations * 1e6
+    print(f"  {label:<58} {per_call_us:>10.1f} us")
+    return per_call_us
+
+
+def main():
+    n_items = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    iterations = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+
+    quote_dict = build_quote(n_items)
+    raw = json.dumps(quote_dict)
+    quote = Quote.model_validate(quote_dict)
+    # The old route returned the quote as an untyped dict; dump the typed quote
+    # so both paths serialize the same fields
+    old_quote = quote.model_dump()
+    envelope = {"success": True, "quote": old_quote, "error": None}
+    field = old_response_field()
+
+    def old_path() -> bytes:
+        # What FastAPI ran for the old route: validate the returned model
+        # against response_model, then dump it (serialize_response, dump_json)
+        value, _ = field.validate(OldQuoteResponse(success=True, quote=old_quote), {}, loc=("response",))
+        return field.serialize_json(value, by_alias=True)
+
+    print(f"Quote with {n_items} items, {len(raw) / 1024:.1f} KiB JSON, {iterations} iterations")
+
+    print("Response serialization (/generate-quote):")
+    old = timed("response_model: validate + serialize_json (previous route)", old_path, iterations)
+    timed("dict -> jsonable_encoder -> json.dumps (no response_model)", lambda: json.dumps(jsonable_encoder(envelope)).encode("utf-8"), iterations)
+    timed("Quote -> model_dump -> orjson.dumps", lambda: orjson.dumps({"success": True, "quote": quote.model_dump(), "error": None}), iterations)
+    new = timed(
+        "QuoteResponse(Quote) -> model_dump_json (model_response)",
+        lambda: QuoteResponse(success=True, quote=quote).model_dump_json(),
+        iterations
+    )
+    print(f"  new/old ratio: {new / old:.1f}x")
+
+    print("Request validation (/download-pdf):")
+    old = timed(
+        "json.loads -> dict, then .get() probing per field",
+        lambda: [(i.get("description"), i.get("qty"), i.get("line_total")) for i in json.loads(raw)["items"]],
+        iterations
+    )
+    new = timed("Quote.model_validate_json (single pass)", lambda: Quote.model_validate_json(raw), iterations)
+    timed("json.loads -> Quote.model_validate (FastAPI body parsing)", lambda: Quote.model_validate(json.loads(raw)), iterations)
+    print(f"  validated/unvalidated ratio: {new / old:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -20,3 +20,51 @@ BUSINESS_ADDRESS = os.getenv("BUSINESS_ADDRESS", "123 Main Street, Sydney NSW 20
 BUSINESS_PHONE = os.getenv("BUSINESS_PHONE", "(02) 1234 5678")
 BUSINESS_EMAIL = os.getenv("BUSINESS_EMAIL", "quotes@tapquote.com.au")
 TAX_RATE = float(os.getenv("TAX_RATE", "10.0"))  # GST %
+
+# Admin API (catalog ingestion etc.) - disabled when unset
+ADMIN_API_KEY = os.getenv("ADMIN_API_KEY", "")
+
+# Local data directory (tenant store, caches, ledgers)
+DATA_DIR = os.getenv("DATA_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data"))
+
+# Tenant Configuration
+# The pricing/business values above are the defaults for the "default" tenant
+# and for any field a tenant does not override.
+TENANTS_FILE = os.getenv("TENANTS_FILE", os.path.join(DATA_DIR, "tenants.json"))
+TENANT_RELOAD_INTERVAL = float(os.getenv("TENANT_RELOAD_INTERVAL", "2.0"))  # seconds
+
+# Materials catalog: updates are persisted here so every worker (and restart) sees them
+CATALOG_FILE = os.getenv("CATALOG_FILE", os.path.join(DATA_DIR, "catalog.json"))
+CATALOG_RELOAD_INTERVAL = float(os.getenv("CATALOG_RELOAD_INTERVAL", "2.0"))  # seconds
+
+# Quote storage
+QUOTES_DB = os.getenv("QUOTES_DB", os.path.join(DATA_DIR, "quotes.db"))
+
+# Bulk export
+EXPORT_WORKERS = int(os.getenv("EXPORT_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+# LLM usage ledger & budgets (USD per day, 0 = unlimited)
+LEDGER_DB = os.getenv("LEDGER_DB", os.path.join(DATA_DIR, "ledger.db"))
+LEDGER_FLUSH_SIZE = int(os.getenv("LEDGER_FLUSH_SIZE", "50"))
+LEDGER_FLUSH_INTERVAL = float(os.getenv("LEDGER_FLUSH_INTERVAL", "5.0"))  # seconds
+DAILY_LLM_BUDGET = float(os.getenv("DAILY_LLM_BUDGET", "0"))
+TENANT_DAILY_LLM_BUDGET = float(os.getenv("TENANT_DAILY_LLM_BUDGET", "0"))
+BUDGET_FALLBACK_MODEL = os.getenv("BUDGET_FALLBACK_MODEL", "")  # empty = deterministic quote path
+
+# Labor estimator (learned from stored quotes)
+ESTIMATOR_MIN_SAMPLES = int(os.getenv("ESTIMATOR_MIN_SAMPLES", "3"))
+ESTIMATOR_SYNC_INTERVAL = float(os.getenv("ESTIMATOR_SYNC_INTERVAL", "30.0"))  # seconds
+
+# Structured output: bind the Quote schema via function calling (falls back to free-form JSON)
+STRUCTURED_OUTPUT = os.getenv("STRUCTURED_OUTPUT", "true").lower() in ("1", "true", "yes")
+
+# Semantic retrieval: local n-gram embeddings fused with keyword search (no network).
+# Helps with misspellings and compound words; it does not know synonyms.
+SEMANTIC_RETRIEVAL = os.getenv("SEMANTIC_RETRIEVAL", "false").lower() in ("1", "true", "yes")
+SEMANTIC_WEIGHT = float(os.getenv("SEMANTIC_WEIGHT", "0.5"))
+SEMANTIC_MIN_SCORE = float(os.getenv("SEMANTIC_MIN_SCORE", "0.2"))
+
+# Shared cache for rendered PDFs and generated quotes (one SQLite file per host, all workers)
+SHARED_CACHE_DB = os.getenv("SHARED_CACHE_DB", os.path.join(DATA_DIR, "cache.db"))
+SHARED_CACHE_MAX_BYTES = int(os.getenv("SHARED_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+QUOTE_CACHE_TTL = float(os.getenv("QUOTE_CACHE_TTL", "86400"))  # seconds, 0 = disable quote caching
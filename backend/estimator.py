@@ -0,0 +1,200 @@
+"""
+TapQuote Labor Estimator
+Learns labor hours per unit from stored quotes, per SKU and per task type,
+so known tasks get fixed hours instead of LLM guesses
+"""
+import threading
+import time
+
+import numpy as np
+
+from config import ESTIMATOR_MIN_SAMPLES, ESTIMATOR_SYNC_INTERVAL
+from models import Quote, QuoteItem
+from quote_store import list_quotes_after
+
+
+# Task types matched against item descriptions, first match wins. Compound
+# tasks come before their component parts: "20A Circuit for pool pump (inc.
+# breaker, 4mm cable 15m, isolator)" is a circuit run, not an isolator.
+TASK_TYPES = [
+    ("circuit_breaker", ("circuit breaker", "mcb")),
+    ("circuit", ("circuit",)),
+    ("rcd", ("rcd", "safety switch")),
+    ("isolator", ("isolator",)),
+    ("smoke_detector", ("smoke",)),
+    ("ceiling_fan", ("fan",)),
+    ("downlight", ("downlight",)),
+    ("weatherproof_gpo", ("weatherproof", "ip54")),
+    ("gpo", ("gpo", "power point", "outlet", "socket")),
+    ("light_switch", ("switch",)),
+    ("cable_run", ("cable",)),
+    ("conduit", ("conduit",)),
+    ("junction_box", ("junction",)),
+]
+
+
+# Typical hours per unit, used only when the LLM omits hours and nothing has been learned yet
+DEFAULT_TASK_HOURS = {
+    "gpo": 0.5,
+    "weatherproof_gpo": 0.75,
+    "downlight": 0.75,
+    "light_switch": 0.5,
+    "smoke_detector": 0.5,
+    "ceiling_fan": 1.5,
+    "rcd": 1.0,
+    "isolator": 0.75,
+    "circuit": 2.5,
+    "circuit_breaker": 0.25,
+}
+
+# Only LLM estimates are learned from: the estimator's own fixed/default
+# outputs would otherwise feed back in. Once a SKU or task type has
+# min_samples estimates its hours are fixed in the prompt and the LLM stops
+# estimating it, so the learned value freezes there (no actual hours are
+# recorded yet to move it).
+TRAINED_HOURS_SOURCES = ("llm",)
+
+
+def classify_task(description: str) -> str | None:
+    """Map an item description to a task type, or None if unrecognised."""
+    description = description.lower()
+    for task_type, keywords in TASK_TYPES:
+        if any(keyword in description for keyword in keywords):
+            return task_type
+    return None
+
+
+def item_keys(item: QuoteItem) -> list[str]:
+    """Estimator keys an item contributes to: its SKU and its task type."""
+    keys = []
+    if item.sku:
+        keys.append(f"sku:{item.sku}")
+    task_type = classify_task(item.description)
+    if task_type:
+        keys.append(f"task:{task_type}")
+    return keys
+
+
+class LaborEstimator:
+    """
+    Mean labor hours per unit for each key, kept as dense NumPy arrays.
+    
+    New quotes are folded in with a bincount over their items, so updates
+    cost O(items), and lookups are a single dict hit on precomputed means.
+    """
+    
+    def __init__(self, min_samples: int = ESTIMATOR_MIN_SAMPLES):
+        self.min_samples = min_samples
+        self._index: dict[str, int] = {}
+        self._sums = np.zeros(0, dtype=np.float64)
+        self._counts = np.zeros(0, dtype=np.int64)
+        self._means: dict[str, float] = {}
+        self._lock = threading.Lock()
+    
+    def _key_ids(self, keys: list[str]) -> np.ndarray:
+        for key in keys:
+            if key not in self._index:
+                self._index[key] = len(self._index)
+        return np.fromiter((self._index[key] for key in keys), dtype=np.int64, count=len(keys))
+    
+    def add_quotes(self, quotes: list[Quote]) -> None:
+        """Fold the items of new quotes (LLM-estimated hours only) into the estimates."""
+        keys = []
+        hours = []
+        for quote in quotes:
+            for item in quote.items:
+                if item.hours_source not in TRAINED_HOURS_SOURCES:
+                    continue
+                if item.estimated_hours is None or item.qty <= 0:
+                    continue
+                per_unit = item.estimated_hours / item.qty
+                for key in item_keys(item):
+                    keys.append(key)
+                    hours.append(per_unit)
+        if not keys:
+            return
+        
+        with self._lock:
+            ids = self._key_ids(keys)
+            size = len(self._index)
+            sums = np.bincount(ids, weights=np.asarray(hours, dtype=np.float64), minlength=size)
+            counts = np.bincount(ids, minlength=size)
+            
+            # Grow to cover any new keys, then accumulate
+            self._sums = np.pad(self._sums, (0, size - len(self._sums))) + sums
+            self._counts = np.pad(self._counts, (0, size - len(self._counts))) + counts
+            
+            touched = np.unique(ids)
+            reliable = touched[self._counts[touched] >= self.min_samples]
+            means = self._sums[reliable] / self._counts[reliable]
+            keys_by_id = {index: key for key, index in self._index.items()}
+            self._means.update({keys_by_id[i]: round(float(m), 2) for i, m in zip(reliable.tolist(), means)})
+    
+    def hours_per_unit(self, sku: str | None = None, description: str | None = None) -> float | None:
+        """Learned hours per unit by SKU, falling back to task type; None if unknown."""
+        if sku:
+            hours = self._means.get(f"sku:{sku}")
+            if hours is not None:
+                return hours
+        if description:
+            task_type = classify_task(description)
+            if task_type:
+                return self._means.get(f"task:{task_type}")
+        return None
+    
+    def hours_or_default(self, sku: str | None, description: str) -> float | None:
+        """Learned hours per unit, else the typical hours for the task type."""
+        hours = self.hours_per_unit(sku, description)
+        if hours is None:
+            hours = DEFAULT_TASK_HOURS.get(classify_task(description))
+        return hours
+    
+    def known_estimates(self) -> dict[str, float]:
+        """All keys with enough samples, and their mean hours per unit."""
+        return dict(self._means)
+
+
+labor_estimator = LaborEstimator()
+_last_rowid = 0
+_last_sync = 0.0
+_sync_lock = threading.Lock()
+
+
+def sync_estimator(force: bool = False) -> LaborEstimator:
+    """
+    Fold quotes stored since the last sync (by any worker) into the
+    estimator, at most every ESTIMATOR_SYNC_INTERVAL seconds.
+    """
+    global _last_rowid, _last_sync
+    
+    now = time.monotonic()
+    if not force and now - _last_sync < ESTIMATOR_SYNC_INTERVAL:
+        return labor_estimator
+    
+    with _sync_lock:
+        _last_sync = now
+        while True:
+            rows = list_quotes_after(_last_rowid)
+            if not rows:
+                break
+            labor_estimator.add_quotes([quote for _, quote in rows])
+            _last_rowid = rows[-1][0]
+    return labor_estimator
+
+
+def fixed_hours_context(materials: list[dict], estimator: LaborEstimator) -> tuple[str, dict[str, float]]:
+    """
+    Build the prompt block of fixed labor hours for retrieved materials.
+    Returns the text and the {sku: hours_per_unit} it promises.
+    """
+    fixed = {}
+    lines = []
+    for material in materials:
+        hours = estimator.hours_per_unit(material["sku"], material["name"])
+        if hours is not None:
+            fixed[material["sku"]] = hours
+            lines.append(f"- {material['name']} (SKU: {material['sku']}): {hours:.2f} hr per unit")
+    
+    if not lines:
+        return "", fixed
+    return "Fixed labor hours (from past jobs - do not estimate these):\n" + "\n".join(lines) + "\n", fixed
@@ -0,0 +1,182 @@
+"""
+TapQuote Bulk Export
+Renders many quote PDFs in parallel worker processes and streams them
+to the client as a ZIP archive, with a CSV summary of totals
+"""
+import asyncio
+import csv
+import io
+import multiprocessing
+import re
+import zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+from typing import AsyncIterator
+
+from starlette.concurrency import run_in_threadpool
+
+from config import EXPORT_WORKERS
+from models import Quote
+from pdf_generator import generate_pdf, pdf_cache_key
+from shared_cache import shared_cache
+from tenants import TenantConfig
+
+
+_pool: ProcessPoolExecutor | None = None
+
+
+def get_export_pool() -> ProcessPoolExecutor:
+    """
+    Return the shared PDF rendering pool, started on first use.
+    Workers are spawned rather than forked from the running server.
+    """
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(
+            max_workers=EXPORT_WORKERS,
+            mp_context=multiprocessing.get_context("spawn")
+        )
+    return _pool
+
+
+def _discard_broken_pool(pool: ProcessPoolExecutor) -> None:
+    """Drop a pool whose worker died so the next submit starts a fresh one."""
+    global _pool
+    pool.shutdown(wait=False, cancel_futures=True)
+    # Other in-flight renders fail with the same pool; don't drop its replacement
+    if _pool is pool:
+        _pool = None
+
+
+class _ChunkWriter(io.RawIOBase):
+    """
+    Non-seekable sink for ZipFile. Written bytes are held only until the
+    next drain(), so the archive is never buffered as a whole.
+    """
+    
+    def __init__(self):
+        self._chunks = []
+    
+    def writable(self) -> bool:
+        return True
+    
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+    
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def _entry_name(index: int, quote_id: str | None, quote: Quote) -> str:
+    customer = re.sub(r"[^A-Za-z0-9_-]+", "_", quote.customer_name).strip("_") or "customer"
+    return f"{index:04d}_{quote_id or 'quote'}_{customer}.pdf"
+
+
+def _summary_csv(rows: list[list]) -> bytes:
+    """Build the CSV summary of quote totals."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(["file", "quote_id", "customer_name", "items", "subtotal", "tax", "grand_total", "status"])
+    writer.writerows(rows)
+    
+    ok_rows = [row for row in rows if row[-1] == "ok"]
+    writer.writerow([
+        "TOTAL", "", "", sum(row[3] for row in ok_rows),
+        f"{sum(row[4] for row in ok_rows):.2f}",
+        f"{sum(row[5] for row in ok_rows):.2f}",
+        f"{sum(row[6] for row in ok_rows):.2f}",
+        f"{len(ok_rows)}/{len(rows)} rendered"
+    ])
+    return buffer.getvalue().encode("utf-8")
+
+
+async def stream_quotes_zip(quotes: list[tuple[str | None, Quote]], tenant: TenantConfig) -> AsyncIterator[bytes]:
+    """
+    Yield a ZIP archive of quote PDFs as each entry completes.
+    
+    At most 2x EXPORT_WORKERS renders are in flight and entries are written
+    in request order, so peak memory is a handful of PDFs regardless of
+    how many quotes are exported. PDFs already in the shared cache are not
+    re-rendered. A quote that fails to render is recorded in summary.csv
+    rather than aborting the archive.
+    """
+    loop = asyncio.get_running_loop()
+    window = max(1, EXPORT_WORKERS * 2)
+    
+    sink = _ChunkWriter()
+    archive = zipfile.ZipFile(sink, mode="w", compression=zipfile.ZIP_STORED)
+    summary_rows = []
+    pending = deque()
+    next_index = 0
+    
+    async def submit():
+        nonlocal next_index
+        quote_id, quote = quotes[next_index]
+        cache_key = pdf_cache_key(quote, tenant)
+        cached = await run_in_threadpool(shared_cache.get, "pdf", cache_key)
+        if cached is not None:
+            # Already rendered (by any worker): skip the pool
+            future = loop.create_future()
+            future.set_result(cached)
+            cache_key = None
+            pool = None
+        else:
+            # Looked up per submit: a broken pool is replaced mid-export
+            pool = get_export_pool()
+            try:
+                future = loop.run_in_executor(pool, generate_pdf, quote, tenant)
+            except BrokenProcessPool:
+                _discard_broken_pool(pool)
+                pool = get_export_pool()
+                try:
+                    future = loop.run_in_executor(pool, generate_pdf, quote, tenant)
+                except BrokenProcessPool as e:
+                    future = loop.create_future()
+                    future.set_exception(e)
+        pending.append((next_index, quote_id, quote, cache_key, pool, future))
+        next_index += 1
+    
+    try:
+        while next_index < len(quotes) and len(pending) < window:
+            await submit()
+        
+        while pending:
+            index, quote_id, quote, cache_key, pool, future = pending.popleft()
+            name = _entry_name(index + 1, quote_id, quote)
+            try:
+                pdf_bytes = await future
+            except Exception as e:
+                if isinstance(e, BrokenProcessPool):
+                    _discard_broken_pool(pool)
+                summary_rows.append(["", quote_id or "", quote.customer_name, len(quote.items), 0, 0, 0, f"error: {e}"])
+            else:
+                # PDFs are already compressed; store them as-is
+                info = zipfile.ZipInfo(name, date_time=datetime.now().timetuple()[:6])
+                archive.writestr(info, pdf_bytes, compress_type=zipfile.ZIP_STORED)
+                summary_rows.append([
+                    name, quote_id or "", quote.customer_name, len(quote.items),
+                    quote.subtotal, quote.tax, quote.grand_total, "ok"
+                ])
+                if cache_key is not None:
+                    await run_in_threadpool(shared_cache.put, "pdf", cache_key, pdf_bytes)
+                del pdf_bytes
+            
+            if next_index < len(quotes):
+                await submit()
+            
+            chunk = sink.drain()
+            if chunk:
+                yield chunk
+    finally:
+        # Client went away (or we failed): don't keep rendering for nobody
+        for *_, future in pending:
+            future.cancel()
+    
+    archive.writestr("summary.csv", _summary_csv(summary_rows), compress_type=zipfile.ZIP_DEFLATED)
+    archive.close()
+    yield sink.drain()
@@ -0,0 +1,267 @@
+"""
+TapQuote Usage Ledger
+Records token usage, cost and latency for every LLM call in an append-only
+local SQLite ledger (batched writes), with aggregated views and daily budgets
+"""
+import atexit
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+
+from config import (
+    OPENAI_MODEL, LEDGER_DB, LEDGER_FLUSH_SIZE, LEDGER_FLUSH_INTERVAL,
+    DAILY_LLM_BUDGET, BUDGET_FALLBACK_MODEL
+)
+from tenants import TenantConfig
+
+
+# USD per 1M tokens: (prompt, completion). Cached prompt tokens bill at CACHED_PROMPT_DISCOUNT.
+MODEL_PRICES = {
+    "gpt-3.5-turbo": (0.50, 1.50),
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4.1-mini": (0.40, 1.60),
+    "gpt-4.1": (2.00, 8.00),
+    **json.loads(os.getenv("LLM_PRICES_JSON", "{}"))
+}
+CACHED_PROMPT_DISCOUNT = 0.5
+
+GROUP_BY_COLUMNS = {
+    "day": "day",
+    "tenant": "tenant_id",
+    "endpoint": "endpoint",
+    "stage": "stage",
+    "model": "model",
+}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS llm_usage (
+    ts REAL NOT NULL,
+    day TEXT NOT NULL,
+    tenant_id TEXT NOT NULL,
+    endpoint TEXT NOT NULL,
+    stage TEXT NOT NULL,
+    model TEXT NOT NULL,
+    prompt_tokens INTEGER NOT NULL,
+    completion_tokens INTEGER NOT NULL,
+    cached_tokens INTEGER NOT NULL,
+    latency_ms REAL NOT NULL,
+    cost_usd REAL NOT NULL,
+    cache_hit INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS llm_usage_day_tenant ON llm_usage (day, tenant_id);
+"""
+
+_lock = threading.Lock()
+_buffer: list[tuple] = []
+_last_flush = time.monotonic()
+_initialized = False
+
+# Running spend per (day, tenant_id); tenant_id None is the deployment total
+_spend: dict[tuple[str, str | None], float] = {}
+_spend_loaded_day: str | None = None
+_spend_loaded_at = 0.0
+
+
+def _today() -> str:
+    return datetime.now(timezone.utc).strftime("%Y-%m-%d")
+
+
+def _connect() -> sqlite3.Connection:
+    """Open a connection, creating the ledger on first use."""
+    global _initialized
+    
+    if not _initialized:
+        os.makedirs(os.path.dirname(LEDGER_DB) or ".", exist_ok=True)
+    conn = sqlite3.connect(LEDGER_DB, timeout=10)
+    if not _initialized:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(_SCHEMA)
+        _initialized = True
+    return conn
+
+
+def estimate_cost(model: str, prompt_tokens: int, completion_tokens: int, cached_tokens: int = 0) -> float:
+    """Estimate the USD cost of a call from the price table (0 for unknown models)."""
+    prompt_price, completion_price = MODEL_PRICES.get(model, (0.0, 0.0))
+    billed_prompt = (prompt_tokens - cached_tokens) + cached_tokens * CACHED_PROMPT_DISCOUNT
+    return (billed_prompt * prompt_price + completion_tokens * completion_price) / 1_000_000
+
+
+def extract_usage(response) -> dict:
+    """Pull token counts from a LangChain AIMessage's usage metadata."""
+    usage = getattr(response, "usage_metadata", None) or {}
+    details = usage.get("input_token_details") or {}
+    return {
+        "prompt_tokens": usage.get("input_tokens", 0),
+        "completion_tokens": usage.get("output_tokens", 0),
+        "cached_tokens": details.get("cache_read", 0) or 0,
+    }
+
+
+def _spend_stale(day: str) -> bool:
+    """Other workers append to the same ledger, so totals are re-read periodically."""
+    return _spend_loaded_day != day or time.monotonic() - _spend_loaded_at >= LEDGER_FLUSH_INTERVAL
+
+
+def _load_spend(day: str) -> None:
+    """
+    Reload today's running totals from the ledger (written by every worker),
+    plus this worker's records still waiting in the buffer.
+    """
+    global _spend_loaded_day, _spend_loaded_at
+    
+    conn = _connect()
+    try:
+        rows = conn.execute(
+            "SELECT tenant_id, SUM(cost_usd) FROM llm_usage WHERE day = ? GROUP BY tenant_id", (day,)
+        ).fetchall()
+    finally:
+        conn.close()
+    
+    rows += [(record[2], record[10]) for record in _buffer if record[1] == day]
+    
+    _spend.clear()
+    for tenant_id, cost in rows:
+        _spend[(day, tenant_id)] = _spend.get((day, tenant_id), 0.0) + cost
+        _spend[(day, None)] = _spend.get((day, None), 0.0) + cost
+    _spend_loaded_day = day
+    _spend_loaded_at = time.monotonic()
+
+
+def record_usage(
+    tenant_id: str,
+    endpoint: str,
+    stage: str,
+    model: str,
+    prompt_tokens: int = 0,
+    completion_tokens: int = 0,
+    cached_tokens: int = 0,
+    latency_ms: float = 0.0,
+    cache_hit: bool = False
+) -> float:
+    """
+    Append one usage record and return its estimated cost.
+    Records are buffered and written in batches.
+    """
+    cost = 0.0 if cache_hit else estimate_cost(model, prompt_tokens, completion_tokens, cached_tokens)
+    day = _today()
+    
+    with _lock:
+        if _spend_stale(day):
+            _load_spend(day)
+        _spend[(day, tenant_id)] = _spend.get((day, tenant_id), 0.0) + cost
+        _spend[(day, None)] = _spend.get((day, None), 0.0) + cost
+        
+        _buffer.append((
+            time.time(), day, tenant_id, endpoint, stage, model,
+            prompt_tokens, completion_tokens, cached_tokens,
+            latency_ms, cost, int(cache_hit)
+        ))
+        should_flush = (
+            len(_buffer) >= LEDGER_FLUSH_SIZE
+            or time.monotonic() - _last_flush >= LEDGER_FLUSH_INTERVAL
+        )
+    
+    if should_flush:
+        flush()
+    return cost
+
+
+def flush() -> None:
+    """
+    Write buffered records to the ledger in one transaction.
+    The batch stays in the buffer, under the lock, until it commits, so
+    _load_spend counts every record exactly once.
+    """
+    global _last_flush
+    
+    with _lock:
+        _last_flush = time.monotonic()
+        if not _buffer:
+            return
+        
+        conn = _connect()
+        try:
+            with conn:
+                conn.executemany(
+                    "INSERT INTO llm_usage VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", _buffer
+                )
+        finally:
+            conn.close()
+        _buffer.clear()
+
+
+atexit.register(flush)
+
+
+def summarize(group_by: str = "day", since: str | None = None, tenant_id: str | None = None) -> list[dict]:
+    """
+    Aggregate usage grouped by day, tenant, endpoint, stage or model.
+    since is an inclusive YYYY-MM-DD day.
+    """
+    column = GROUP_BY_COLUMNS.get(group_by)
+    if column is None:
+        raise ValueError(f"group_by must be one of: {', '.join(GROUP_BY_COLUMNS)}")
+    
+    flush()
+    
+    query = f"""
+        SELECT {column}, COUNT(*), SUM(prompt_tokens), SUM(completion_tokens), SUM(cached_tokens),
+               SUM(cost_usd), AVG(latency_ms), SUM(cache_hit)
+        FROM llm_usage WHERE 1 = 1
+    """
+    params = []
+    if since is not None:
+        query += " AND day >= ?"
+        params.append(since)
+    if tenant_id is not None:
+        query += " AND tenant_id = ?"
+        params.append(tenant_id)
+    query += f" GROUP BY {column} ORDER BY {column}"
+    
+    conn = _connect()
+    try:
+        rows = conn.execute(query, params).fetchall()
+    finally:
+        conn.close()
+    
+    return [
+        {
+            group_by: key,
+            "calls": calls,
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "cached_tokens": cached_tokens,
+            "cost_usd": round(cost, 6),
+            "avg_latency_ms": round(latency, 1),
+            "cache_hits": cache_hits,
+        }
+        for key, calls, prompt_tokens, completion_tokens, cached_tokens, cost, latency, cache_hits in rows
+    ]
+
+
+def spent_today(tenant_id: str | None = None) -> float:
+    """Return today's estimated spend for a tenant, or for the whole deployment."""
+    day = _today()
+    with _lock:
+        if _spend_stale(day):
+            _load_spend(day)
+        return _spend.get((day, tenant_id), 0.0)
+
+
+def select_model(tenant: TenantConfig) -> str | None:
+    """
+    Pick the model for a tenant's next LLM call under the daily budgets.
+    Returns BUDGET_FALLBACK_MODEL once a budget is exceeded, or None to
+    signal the deterministic (no-LLM) quote path when no fallback is set.
+    """
+    over_tenant = tenant.daily_llm_budget > 0 and spent_today(tenant.tenant_id) >= tenant.daily_llm_budget
+    over_global = DAILY_LLM_BUDGET > 0 and spent_today() >= DAILY_LLM_BUDGET
+    
+    if over_tenant or over_global:
+        return BUDGET_FALLBACK_MODEL or None
+    return OPENAI_MODEL
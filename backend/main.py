@@ -2,16 +2,31 @@
 TapQuote FastAPI Backend
 Main application entry point with API endpoints
 """
-from fastapi import FastAPI, HTTPException
+import os
+from fastapi import Depends, FastAPI, Header, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
-from pydantic import BaseModel
-import io
+from fastapi.responses import Response, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from pydantic import BaseModel, Field
+from dataclasses import asdict
+from datetime import datetime
 
-from config import OPENAI_API_KEY, LABOR_RATE, MATERIAL_MARKUP
-from agent import generate_quote, generate_mock_quote
-from pdf_generator import generate_pdf
-from materials import get_all_materials, search_materials
+from config import OPENAI_API_KEY, ADMIN_API_KEY, QUOTE_CACHE_TTL
+from agent import generate_quote, generate_mock_quote, quote_cache_key
+from estimator import sync_estimator
+from export import stream_quotes_zip
+from ledger import record_usage, select_model, spent_today, summarize
+from models import Quote
+from quote_parser import parse_stats
+from pdf_generator import get_or_render_pdf
+from materials import apply_catalog_update, get_catalog, get_catalog_changes
+from payloads import (
+    decode_cursor, dumps, encode_cursor, get_catalog_payload, get_search_payload, model_response,
+    payload_response
+)
+from quote_store import get_quotes, save_quote
+from shared_cache import shared_cache
+from tenants import BRAND_COLOR_PATTERN, TenantConfig, get_tenant_config, list_tenants, update_tenant_config
 
 
 # Initialize FastAPI app
@@ -39,12 +54,64 @@ class QuoteRequest(BaseModel):
 
 class QuoteResponse(BaseModel):
     success: bool
-    quote: dict | None = None
+    quote: Quote | None = None
+    quote_id: str | None = None
     error: str | None = None
 
 
 class PDFRequest(BaseModel):
-    quote: dict
+    quote: Quote
+
+
+class ExportRequest(BaseModel):
+    quotes: list[Quote] = []
+    quote_ids: list[str] = []
+
+
+class MaterialUpdate(BaseModel):
+    id: str
+    name: str | None = None
+    sku: str | None = None
+    base_cost: float | None = None
+    category: str | None = None
+    keywords: list[str] | None = None
+
+
+class CatalogUpdateRequest(BaseModel):
+    upserts: list[MaterialUpdate] = []
+    remove_ids: list[str] = []
+
+
+class TenantUpdate(BaseModel):
+    labor_rate: float | None = Field(default=None, ge=0)
+    material_markup: float | None = Field(default=None, ge=0)
+    tax_rate: float | None = Field(default=None, ge=0)
+    business_name: str | None = None
+    business_address: str | None = None
+    business_phone: str | None = None
+    business_email: str | None = None
+    brand_color: str | None = Field(default=None, pattern=BRAND_COLOR_PATTERN)
+    logo_path: str | None = None
+    daily_llm_budget: float | None = Field(default=None, ge=0)
+
+
+def get_tenant(x_tenant_id: str | None = Header(default=None)) -> TenantConfig:
+    """Resolve the request's tenant config from the X-Tenant-ID header."""
+    try:
+        return get_tenant_config(x_tenant_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Unknown tenant: {x_tenant_id}")
+
+
+def require_admin(x_admin_key: str | None = Header(default=None)):
+    """Guard admin endpoints with the ADMIN_API_KEY header."""
+    if not ADMIN_API_KEY or x_admin_key != ADMIN_API_KEY:
+        raise HTTPException(status_code=403, detail="Admin access required")
+
+
+def _cache_headers(hit: bool) -> dict:
+    """Shared-cache outcome and the worker that served the request."""
+    return {"X-Cache": "HIT" if hit else "MISS", "X-Served-By": str(os.getpid())}
 
 
 # Health check endpoint
@@ -64,39 +131,137 @@ async def health():
 
 # Configuration endpoint
 @app.get("/config")
-async def get_config():
-    """Return current pricing configuration."""
+async def get_config(tenant: TenantConfig = Depends(get_tenant)):
+    """Return current pricing configuration for the tenant."""
     return {
-        "labor_rate": LABOR_RATE,
-        "material_markup": MATERIAL_MARKUP,
+        "tenant_id": tenant.tenant_id,
+        "labor_rate": tenant.labor_rate,
+        "material_markup": tenant.material_markup,
+        "tax_rate": tenant.tax_rate,
         "api_configured": bool(OPENAI_API_KEY)
     }
 
 
 # Materials endpoint
 @app.get("/materials")
-async def list_materials():
-    """List all available materials."""
+async def list_materials(
+    request: Request,
+    limit: int | None = Query(default=None, ge=1, le=1000),
+    cursor: str | None = None,
+    since: int | None = Query(default=None, ge=0)
+):
+    """
+    List all available materials.
+    
+    - No params: the full catalog, pre-serialized per catalog version,
+      compressed and ETag-revalidated.
+    - since=<version>: only materials changed and ids removed after that version.
+    - limit/cursor: cursor pagination pinned to one catalog version.
+    """
+    catalog = get_catalog()
+    
+    if since is not None:
+        return {
+            "catalog_version": catalog.version,
+            "since": since,
+            **get_catalog_changes(since, catalog)
+        }
+    
+    if limit is None and cursor is None:
+        return payload_response(request, get_catalog_payload(catalog))
+    
+    offset = 0
+    if cursor is not None:
+        try:
+            version, offset = decode_cursor(cursor)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        if version != catalog.version:
+            raise HTTPException(
+                status_code=409,
+                detail=f"Catalog changed (now version {catalog.version}); restart paging or use since"
+            )
+        if offset > len(catalog.materials):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+    
+    limit = limit or 100
+    page = catalog.materials[offset:offset + limit]
+    next_offset = offset + len(page)
     return {
-        "materials": get_all_materials(),
-        "count": len(get_all_materials())
+        "materials": list(page),
+        "count": len(page),
+        "total": len(catalog.materials),
+        "catalog_version": catalog.version,
+        "next_cursor": encode_cursor(catalog.version, next_offset) if next_offset < len(catalog.materials) else None
     }
 
 
+@app.get("/materials/stream")
+async def stream_materials():
+    """
+    Stream the catalog as NDJSON: a header line with the catalog version,
+    then one material per line.
+    """
+    catalog = get_catalog()
+    
+    def lines():
+        yield dumps({"catalog_version": catalog.version, "count": len(catalog.materials)}) + b"\n"
+        batch = []
+        for material in catalog.materials:
+            batch.append(dumps(material))
+            if len(batch) == 500:
+                yield b"\n".join(batch) + b"\n"
+                batch = []
+        if batch:
+            yield b"\n".join(batch) + b"\n"
+    
+    return StreamingResponse(
+        lines(),
+        media_type="application/x-ndjson",
+        headers={"ETag": f'"catalog-v{catalog.version}"'}
+    )
+
+
 @app.get("/materials/search")
-async def search_materials_endpoint(q: str):
+async def search_materials_endpoint(request: Request, q: str):
     """Search materials by keyword."""
-    results = search_materials(q)
+    return payload_response(request, get_search_payload(q, get_catalog()))
+
+
+# Admin catalog ingestion
+@app.get("/admin/catalog", dependencies=[Depends(require_admin)])
+async def catalog_status():
+    """Return the live catalog version and size."""
+    catalog = get_catalog()
+    return {
+        "catalog_version": catalog.version,
+        "count": len(catalog.materials)
+    }
+
+
+@app.post("/admin/catalog", dependencies=[Depends(require_admin)])
+async def update_catalog(request: CatalogUpdateRequest):
+    """
+    Apply price/item changes as a new catalog version.
+    In-flight requests keep pricing against the version they started with.
+    """
+    try:
+        catalog = apply_catalog_update(
+            upserts=[item.model_dump(exclude_none=True) for item in request.upserts],
+            remove_ids=request.remove_ids
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
     return {
-        "query": q,
-        "results": results,
-        "count": len(results)
+        "catalog_version": catalog.version,
+        "count": len(catalog.materials)
     }
 
 
 # Quote generation endpoint
 @app.post("/generate-quote", response_model=QuoteResponse)
-async def generate_quote_endpoint(request: QuoteRequest):
+async def generate_quote_endpoint(request: QuoteRequest, tenant: TenantConfig = Depends(get_tenant)):
     """
     Generate a quote from a job description.
     Uses OpenAI API if configured, otherwise falls back to mock.
@@ -105,56 +270,83 @@ async def generate_quote_endpoint(request: QuoteRequest):
         if not request.job_description.strip():
             raise HTTPException(status_code=400, detail="Job description is required")
         
-        # Use real LLM if API key is configured, otherwise mock
-        if OPENAI_API_KEY:
+        # Use real LLM if API key is configured and within budget, otherwise mock
+        model = select_model(tenant) if OPENAI_API_KEY else None
+        
+        # One snapshot for both the cache key and pricing
+        catalog = get_catalog()
+        
+        cache_key = None
+        if model and QUOTE_CACHE_TTL > 0:
+            # Identical requests are served from the shared cache, by any worker
+            cache_key = quote_cache_key(
+                request.job_description, request.customer_name, tenant, catalog.version, model
+            )
+            cached = await run_in_threadpool(shared_cache.get, "quote", cache_key)
+            if cached is not None:
+                record_usage(tenant.tenant_id, "/generate-quote", "quote", model, cache_hit=True)
+                return Response(content=cached, media_type="application/json", headers=_cache_headers(True))
+        
+        if model:
             quote = await generate_quote(
                 job_description=request.job_description,
-                customer_name=request.customer_name
+                customer_name=request.customer_name,
+                tenant=tenant,
+                model=model,
+                catalog=catalog
             )
         else:
-            # Use mock for testing
+            if OPENAI_API_KEY:
+                # Budget exceeded with no fallback model: record the deterministic quote
+                record_usage(tenant.tenant_id, "/generate-quote", "quote", "deterministic")
+            
+            # Use mock for testing (or when over budget)
             quote = generate_mock_quote(
                 job_description=request.job_description,
-                customer_name=request.customer_name
+                customer_name=request.customer_name,
+                tenant=tenant,
+                catalog=catalog
             )
         
-        if "error" in quote:
-            return QuoteResponse(
-                success=False,
-                error=quote.get("error")
-            )
+        quote_id = save_quote(quote, tenant.tenant_id)
+        sync_estimator(force=True)
         
-        return QuoteResponse(
+        response = model_response(QuoteResponse(
             success=True,
-            quote=quote
-        )
+            quote=quote,
+            quote_id=quote_id
+        ))
+        if cache_key is not None:
+            await run_in_threadpool(shared_cache.put, "quote", cache_key, response.body, ttl=QUOTE_CACHE_TTL)
+        response.headers.update(_cache_headers(False))
+        return response
         
     except Exception as e:
-        return QuoteResponse(
+        return model_response(QuoteResponse(
             success=False,
             error=str(e)
-        )
+        ))
 
 
 # PDF generation endpoint
 @app.post("/download-pdf")
-async def download_pdf(request: PDFRequest):
+async def download_pdf(request: PDFRequest, tenant: TenantConfig = Depends(get_tenant)):
     """
     Generate and download a PDF from quote data.
+    The quote is validated once into a Quote model by the request body.
+    X-Cache tells whether the PDF came from the shared cache.
     """
     try:
-        if not request.quote:
-            raise HTTPException(status_code=400, detail="Quote data is required")
-        
-        # Generate PDF
-        pdf_bytes = generate_pdf(request.quote)
+        # Generate PDF (or reuse one rendered by any worker), off the event loop
+        pdf_bytes, cache_hit = await run_in_threadpool(get_or_render_pdf, request.quote, tenant)
         
         # Return as downloadable file
-        return StreamingResponse(
-            io.BytesIO(pdf_bytes),
+        return Response(
+            content=pdf_bytes,
             media_type="application/pdf",
             headers={
-                "Content-Disposition": f"attachment; filename=quote_{request.quote.get('customer_name', 'customer').replace(' ', '_')}.pdf"
+                "Content-Disposition": f"attachment; filename=quote_{request.quote.customer_name.replace(' ', '_')}.pdf",
+                **_cache_headers(cache_hit)
             }
         )
         
@@ -162,6 +354,93 @@ async def download_pdf(request: PDFRequest):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+# Bulk export endpoint
+@app.post("/export-zip")
+async def export_zip(request: ExportRequest, tenant: TenantConfig = Depends(get_tenant)):
+    """
+    Export many quotes as a ZIP of PDFs plus summary.csv.
+    Accepts inline quotes and/or stored quote IDs; the archive is streamed
+    as PDFs finish rendering.
+    """
+    stored = get_quotes(request.quote_ids, tenant.tenant_id)
+    missing = [quote_id for quote_id in request.quote_ids if quote_id not in stored]
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Unknown quote ids: {', '.join(missing)}")
+    
+    quotes = [(quote_id, stored[quote_id]) for quote_id in request.quote_ids]
+    quotes += [(None, quote) for quote in request.quotes]
+    if not quotes:
+        raise HTTPException(status_code=400, detail="No quotes to export")
+    
+    filename = f"quotes_{tenant.tenant_id}_{datetime.now().strftime('%Y%m%d%H%M%S')}.zip"
+    return StreamingResponse(
+        stream_quotes_zip(quotes, tenant),
+        media_type="application/zip",
+        headers={"Content-Disposition": f"attachment; filename={filename}"}
+    )
+
+
+# Admin usage ledger
+@app.get("/admin/usage", dependencies=[Depends(require_admin)])
+async def usage_endpoint(group_by: str = "day", since: str | None = None, tenant_id: str | None = None):
+    """
+    Aggregated LLM token usage and estimated cost.
+    group_by: day, tenant, endpoint, stage or model; since: YYYY-MM-DD.
+    """
+    try:
+        rows = summarize(group_by=group_by, since=since, tenant_id=tenant_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    return {
+        "group_by": group_by,
+        "rows": rows,
+        "spent_today_usd": round(spent_today(tenant_id), 6)
+    }
+
+
+@app.get("/admin/parse-stats", dependencies=[Depends(require_admin)])
+async def parse_stats_endpoint():
+    """How LLM quote output was recovered in this worker, and the parse-failure rate."""
+    return parse_stats.snapshot()
+
+
+# Admin shared cache
+@app.get("/admin/cache", dependencies=[Depends(require_admin)])
+async def cache_stats_endpoint():
+    """Shared PDF/quote cache size and hit rates per worker process."""
+    return await run_in_threadpool(shared_cache.stats)
+
+
+# Admin labor estimator
+@app.get("/admin/labor-estimates", dependencies=[Depends(require_admin)])
+async def labor_estimates_endpoint():
+    """Learned labor hours per unit, by SKU and task type."""
+    return {"estimates": sync_estimator().known_estimates()}
+
+
+# Admin tenant configuration
+@app.get("/admin/tenants", dependencies=[Depends(require_admin)])
+async def list_tenants_endpoint():
+    """List all tenant configs."""
+    return {"tenants": [asdict(tenant) for tenant in list_tenants()]}
+
+
+@app.put("/admin/tenants/{tenant_id}", dependencies=[Depends(require_admin)])
+async def update_tenant_endpoint(tenant_id: str, request: TenantUpdate):
+    """
+    Create or update a tenant's pricing/branding.
+    Invalid values (negative rates, non-hex colors, unreadable logos) are rejected.
+    Bumps the tenant's config version, which invalidates its cached PDF assets.
+    """
+    try:
+        tenant = update_tenant_config(tenant_id, request.model_dump(exclude_none=True))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    return asdict(tenant)
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -1,7 +1,31 @@
 """
 Mock Electrical Materials Database
 Simulates Airtable/supplier data for the MVP
+
+The live catalog is held as an immutable, versioned snapshot. Price and item
+updates build a new snapshot copy-on-write and swap it in atomically, so
+in-flight searches always see one consistent version.
+
+Updates are also persisted to CATALOG_FILE. Every worker process reloads
+it when its version moves on (rebuilding its own snapshot and keyword
+index), so all workers (and restarts) serve the same catalog versions.
 """
+import os
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Mapping
+
+import orjson
+
+from config import CATALOG_FILE, CATALOG_RELOAD_INTERVAL
+
+try:
+    import fcntl
+except ImportError:  # Not available on Windows: updates are then only serialized per process
+    fcntl = None
 
 MATERIALS_DATABASE = [
     {
@@ -127,47 +151,303 @@ MATERIALS_DATABASE = [
 ]
 
 
-def search_materials(query: str) -> list:
+@dataclass(frozen=True)
+class CatalogSnapshot:
+    """
+    A single immutable version of the materials catalog.
+    Material dicts are never mutated once published; updates replace them.
+    """
+    version: int
+    materials: tuple
+    by_id: Mapping[str, dict]
+    keyword_index: Mapping[str, tuple]
+    item_versions: Mapping[str, int]
+    removed: Mapping[str, int]
+
+
+REQUIRED_MATERIAL_FIELDS = ("name", "sku", "base_cost", "category", "keywords")
+
+_catalog_lock = threading.Lock()
+
+
+def _normalize_material(material: dict) -> dict:
+    """Validate a material record and coerce its fields."""
+    missing = [field for field in REQUIRED_MATERIAL_FIELDS if field not in material]
+    if missing:
+        raise ValueError(f"Material {material.get('id')} is missing fields: {', '.join(missing)}")
+    
+    base_cost = float(material["base_cost"])
+    if base_cost < 0:
+        raise ValueError(f"Material {material['id']} has a negative base_cost")
+    
+    return {
+        **material,
+        "base_cost": base_cost,
+        "keywords": [keyword.lower() for keyword in material["keywords"]]
+    }
+
+
+def _index_material(keyword_index: dict, material: dict) -> None:
+    """Add a material's keywords to a (copied) keyword index."""
+    for keyword in material["keywords"]:
+        keyword_index[keyword] = keyword_index.get(keyword, ()) + (material["id"],)
+
+
+def _unindex_material(keyword_index: dict, material: dict) -> None:
+    """Remove a material's keywords from a (copied) keyword index."""
+    for keyword in material["keywords"]:
+        ids = list(keyword_index.get(keyword, ()))
+        if material["id"] in ids:
+            ids.remove(material["id"])
+        if ids:
+            keyword_index[keyword] = tuple(ids)
+        else:
+            keyword_index.pop(keyword, None)
+
+
+def _build_snapshot(materials: list, version: int) -> CatalogSnapshot:
+    """Build a snapshot from scratch (the seed catalog, or one loaded from CATALOG_FILE)."""
+    by_id = {}
+    keyword_index = {}
+    for material in materials:
+        material = _normalize_material(material)
+        by_id[material["id"]] = material
+        _index_material(keyword_index, material)
+    
+    return CatalogSnapshot(
+        version=version,
+        materials=tuple(by_id.values()),
+        by_id=MappingProxyType(by_id),
+        keyword_index=MappingProxyType(keyword_index),
+        item_versions=MappingProxyType({material_id: version for material_id in by_id}),
+        removed=MappingProxyType({})
+    )
+
+
+def _snapshot_record(snapshot: CatalogSnapshot) -> dict:
+    return {
+        "version": snapshot.version,
+        "materials": list(snapshot.materials),
+        "item_versions": dict(snapshot.item_versions),
+        "removed": dict(snapshot.removed),
+    }
+
+
+def _snapshot_from_record(record: dict) -> CatalogSnapshot:
+    """Rebuild a snapshot (and its keyword index) from the catalog file."""
+    snapshot = _build_snapshot(record["materials"], version=record["version"])
+    return CatalogSnapshot(
+        version=snapshot.version,
+        materials=snapshot.materials,
+        by_id=snapshot.by_id,
+        keyword_index=snapshot.keyword_index,
+        item_versions=MappingProxyType(dict(record["item_versions"])),
+        removed=MappingProxyType(dict(record["removed"]))
+    )
+
+
+def _read_catalog_file() -> dict | None:
+    """Read the shared catalog file, or None if it is missing or unreadable."""
+    try:
+        with open(CATALOG_FILE, "rb") as f:
+            return orjson.loads(f.read())
+    except (FileNotFoundError, orjson.JSONDecodeError):
+        return None
+
+
+def _write_catalog_file(snapshot: CatalogSnapshot) -> None:
+    """Atomically replace the shared catalog file."""
+    os.makedirs(os.path.dirname(CATALOG_FILE) or ".", exist_ok=True)
+    tmp_path = f"{CATALOG_FILE}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(orjson.dumps(_snapshot_record(snapshot)))
+    os.replace(tmp_path, CATALOG_FILE)
+
+
+@contextmanager
+def _catalog_file_lock():
+    """Serialize catalog updates across worker processes."""
+    if fcntl is None:
+        yield
+        return
+    os.makedirs(os.path.dirname(CATALOG_FILE) or ".", exist_ok=True)
+    with open(f"{CATALOG_FILE}.lock", "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+_catalog_mtime: float | None = None
+_catalog_checked = 0.0
+
+
+def _reload_if_changed(force: bool = False) -> None:
+    """
+    Adopt a newer catalog version published by another worker (checked at
+    most every CATALOG_RELOAD_INTERVAL seconds, by file mtime).
+    """
+    global _catalog, _catalog_mtime, _catalog_checked
+    
+    now = time.monotonic()
+    if not force and now - _catalog_checked < CATALOG_RELOAD_INTERVAL:
+        return
+    _catalog_checked = now
+    
+    try:
+        mtime = os.stat(CATALOG_FILE).st_mtime
+    except FileNotFoundError:
+        return
+    if not force and mtime == _catalog_mtime:
+        return
+    
+    record = _read_catalog_file()
+    _catalog_mtime = mtime
+    if record is not None and record["version"] > _catalog.version:
+        _catalog = _snapshot_from_record(record)
+
+
+_catalog = _build_snapshot(MATERIALS_DATABASE, version=1)
+_reload_if_changed(force=True)
+
+
+def get_catalog() -> CatalogSnapshot:
+    """
+    Return the current catalog snapshot.
+    Callers should take one snapshot per request and use it throughout.
+    """
+    _reload_if_changed()
+    return _catalog
+
+
+def get_catalog_version() -> int:
+    """Return the current catalog version (use as a cache key component)."""
+    return get_catalog().version
+
+
+def apply_catalog_update(upserts: list[dict] | None = None, remove_ids: list[str] | None = None) -> CatalogSnapshot:
+    """
+    Apply a delta of item upserts and removals as a new catalog version.
+    
+    Upserts for an existing id are merged over the current record, so a
+    price-only update is just {"id": ..., "base_cost": ...}. New ids must
+    carry every required field. Only the changed entries are re-indexed;
+    the new snapshot is written to CATALOG_FILE for the other workers and
+    published here with a single reference swap.
+    """
+    global _catalog, _catalog_mtime
+    
+    upserts = upserts or []
+    remove_ids = remove_ids or []
+    
+    with _catalog_lock, _catalog_file_lock():
+        # Build on the latest version, whichever worker published it
+        _reload_if_changed(force=True)
+        base = _catalog
+        version = base.version + 1
+        by_id = dict(base.by_id)
+        keyword_index = dict(base.keyword_index)
+        item_versions = dict(base.item_versions)
+        removed = dict(base.removed)
+        
+        for change in upserts:
+            material_id = change.get("id")
+            if not material_id:
+                raise ValueError("Every catalog upsert needs an id")
+            
+            previous = by_id.get(material_id)
+            material = _normalize_material({**previous, **change} if previous else dict(change))
+            
+            if previous is not None:
+                _unindex_material(keyword_index, previous)
+            _index_material(keyword_index, material)
+            by_id[material_id] = material
+            item_versions[material_id] = version
+            removed.pop(material_id, None)
+        
+        for material_id in remove_ids:
+            previous = by_id.pop(material_id, None)
+            if previous is None:
+                raise ValueError(f"Unknown material id: {material_id}")
+            _unindex_material(keyword_index, previous)
+            item_versions.pop(material_id, None)
+            removed[material_id] = version
+        
+        # Keep existing catalog order; new items go on the end
+        ordered = [by_id[m["id"]] for m in base.materials if m["id"] in by_id]
+        existing_ids = base.by_id.keys()
+        ordered += [m for material_id, m in by_id.items() if material_id not in existing_ids]
+        
+        snapshot = CatalogSnapshot(
+            version=version,
+            materials=tuple(ordered),
+            by_id=MappingProxyType(by_id),
+            keyword_index=MappingProxyType(keyword_index),
+            item_versions=MappingProxyType(item_versions),
+            removed=MappingProxyType(removed)
+        )
+        _write_catalog_file(snapshot)
+        _catalog_mtime = os.stat(CATALOG_FILE).st_mtime
+        _catalog = snapshot
+        return _catalog
+
+
+def search_materials(query: str, catalog: CatalogSnapshot | None = None) -> list:
     """
     Search materials database using keyword matching.
     Returns list of matching materials with relevance scores.
     """
+    catalog = catalog or get_catalog()
     query_terms = query.lower().split()
-    results = []
+    scores = {}
     
-    for material in MATERIALS_DATABASE:
-        score = 0
-        keywords = material["keywords"]
-        name_lower = material["name"].lower()
-        
-        for term in query_terms:
-            # Check keywords
-            for keyword in keywords:
-                if term in keyword or keyword in term:
-                    score += 2
-            # Check name
-            if term in name_lower:
-                score += 1
-        
-        if score > 0:
-            results.append({
-                **material,
-                "relevance_score": score
-            })
+    for term in query_terms:
+        # Check keywords
+        for keyword, material_ids in catalog.keyword_index.items():
+            if term in keyword or keyword in term:
+                for material_id in material_ids:
+                    scores[material_id] = scores.get(material_id, 0) + 2
+        # Check name
+        for material in catalog.materials:
+            if term in material["name"].lower():
+                scores[material["id"]] = scores.get(material["id"], 0) + 1
+    
+    results = [
+        {**material, "relevance_score": scores[material["id"]]}
+        for material in catalog.materials
+        if scores.get(material["id"], 0) > 0
+    ]
     
     # Sort by relevance
     results.sort(key=lambda x: x["relevance_score"], reverse=True)
     return results
 
 
-def get_material_by_id(material_id: str) -> dict | None:
+def get_material_by_id(material_id: str, catalog: CatalogSnapshot | None = None) -> dict | None:
     """Get a specific material by ID."""
-    for material in MATERIALS_DATABASE:
-        if material["id"] == material_id:
-            return material
-    return None
+    catalog = catalog or get_catalog()
+    return catalog.by_id.get(material_id)
+
+
+def get_catalog_changes(since_version: int, catalog: CatalogSnapshot | None = None) -> dict:
+    """
+    Return materials added/changed and ids removed after since_version,
+    so clients can pull only what changed.
+    """
+    catalog = catalog or get_catalog()
+    changed = [
+        material for material in catalog.materials
+        if catalog.item_versions[material["id"]] > since_version
+    ]
+    removed_ids = [
+        material_id for material_id, version in catalog.removed.items()
+        if version > since_version
+    ]
+    return {"changed": changed, "removed_ids": removed_ids}
 
 
-def get_all_materials() -> list:
+def get_all_materials(catalog: CatalogSnapshot | None = None) -> list:
     """Return all materials in the database."""
-    return MATERIALS_DATABASE
+    catalog = catalog or get_catalog()
+    return list(catalog.materials)
@@ -0,0 +1,55 @@
+"""
+TapQuote Quote Models
+Validated once at the API boundary and passed typed to the agent and PDF generator
+"""
+from typing import Literal
+
+from pydantic import BaseModel, ConfigDict, Field
+
+
+# Pydantic models for structured output. The LLM-facing schemas leave out
+# fields the server owns; their titles keep the tool names the LLM sees.
+class LLMQuoteItem(BaseModel):
+    model_config = ConfigDict(title="QuoteItem")
+    
+    description: str = Field(description="Description of the work item")
+    sku: str | None = Field(description="Catalog SKU of the main material, if from the database", default=None)
+    qty: int = Field(description="Quantity of items", default=1)
+    unit_material_cost: float = Field(description="Cost per unit after markup")
+    estimated_hours: float | None = Field(description="Estimated labor hours (omitted when fixed hours apply)", default=None)
+    labor_cost: float = Field(description="Labor cost (hours * rate)", default=0.0)
+    line_total: float = Field(description="Total for this line item", default=0.0)
+    is_estimate: bool = Field(description="True if price is estimated (not from database)", default=False)
+
+
+class LLMQuote(BaseModel):
+    model_config = ConfigDict(title="Quote")
+    
+    customer_name: str = Field(description="Customer name", default="Customer")
+    job_summary: str = Field(description="Brief summary of the job")
+    items: list[LLMQuoteItem] = Field(description="List of quote line items")
+    subtotal: float = Field(description="Subtotal before tax")
+    tax: float = Field(description="Tax amount (GST)")
+    grand_total: float = Field(description="Grand total including tax")
+
+
+class QuoteItem(LLMQuoteItem):
+    hours_source: Literal["llm", "fixed", "default"] | None = Field(
+        description="Where estimated_hours came from (set by the server)",
+        default=None
+    )
+    
+    @classmethod
+    def from_llm(cls, item: LLMQuoteItem) -> "QuoteItem":
+        """Promote an LLM line item; server-owned fields start unset."""
+        return cls.model_validate(item.model_dump())
+
+
+class Quote(LLMQuote):
+    items: list[QuoteItem] = Field(description="List of quote line items")
+    catalog_version: int | None = Field(description="Catalog version the quote was priced against", default=None)
+    
+    @classmethod
+    def from_llm(cls, quote: LLMQuote) -> "Quote":
+        """Promote an LLM quote; server-owned fields start unset."""
+        return cls.model_validate(quote.model_dump())
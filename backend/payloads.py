@@ -0,0 +1,191 @@
+"""
+TapQuote Precomputed Payloads
+Pre-serialized, compressed catalog responses with ETag revalidation,
+plus a bounded LRU of search results keyed on catalog version
+"""
+import base64
+import gzip
+import hashlib
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+
+import orjson
+from fastapi import Request, Response
+from pydantic import BaseModel
+
+from materials import CatalogSnapshot, search_materials
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; gzip is always available
+    brotli = None
+
+
+SEARCH_CACHE_SIZE = 512
+
+
+def dumps(data) -> bytes:
+    """Serialize a response payload to compact JSON bytes."""
+    return orjson.dumps(data)
+
+
+def model_response(model: BaseModel, status_code: int = 200) -> Response:
+    """
+    Serialize an already validated model straight to JSON bytes with
+    pydantic-core, skipping FastAPI's response_model re-validation.
+    """
+    return Response(content=model.model_dump_json(), status_code=status_code, media_type="application/json")
+
+
+@dataclass(frozen=True)
+class Payload:
+    """A serialized response body with its ETag and compressed variants."""
+    etag: str
+    body: bytes
+    gzip_body: bytes | None = None
+    br_body: bytes | None = None
+
+
+class LRUCache:
+    """Small thread-safe LRU with hit/miss counters."""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, value) -> None:
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+
+def _compressed(etag: str, body: bytes) -> Payload:
+    return Payload(
+        etag=etag,
+        body=body,
+        gzip_body=gzip.compress(body, compresslevel=6),
+        br_body=brotli.compress(body, quality=9) if brotli else None
+    )
+
+
+# One slot: only the live catalog version is worth keeping
+_catalog_payload: dict[int, Payload] = {}
+_catalog_payload_lock = threading.Lock()
+
+
+def get_catalog_payload(catalog: CatalogSnapshot) -> Payload:
+    """Return the full /materials body, serialized and compressed once per catalog version."""
+    payload = _catalog_payload.get(catalog.version)
+    if payload is not None:
+        return payload
+
+    with _catalog_payload_lock:
+        payload = _catalog_payload.get(catalog.version)
+        if payload is None:
+            body = dumps({
+                "materials": list(catalog.materials),
+                "count": len(catalog.materials),
+                "catalog_version": catalog.version
+            })
+            payload = _compressed(f'"catalog-v{catalog.version}"', body)
+            _catalog_payload.clear()
+            _catalog_payload[catalog.version] = payload
+    return payload
+
+
+def normalize_query(query: str) -> str:
+    """
+    Normalize a search query for caching.
+    Term order does not affect keyword scores, so terms are sorted.
+    """
+    return " ".join(sorted(query.lower().split()))
+
+
+search_cache = LRUCache(SEARCH_CACHE_SIZE)
+
+
+def get_search_payload(query: str, catalog: CatalogSnapshot) -> Payload:
+    """
+    Return the /materials/search body for a query.
+    Results are cached on (normalized query, catalog version), so a catalog
+    update simply stops old entries from matching rather than flushing.
+    """
+    key = (normalize_query(query), catalog.version)
+    cached = search_cache.get(key)
+    if cached is None:
+        results = search_materials(key[0], catalog)
+        cached = (dumps(results), len(results))
+        search_cache.put(key, cached)
+
+    results_json, count = cached
+    body = b"".join([
+        b'{"query":', dumps(query),
+        b',"results":', results_json,
+        b',"count":', str(count).encode(),
+        b',"catalog_version":', str(catalog.version).encode(), b"}"
+    ])
+    digest = hashlib.blake2b(key[0].encode("utf-8"), digest_size=8).hexdigest()
+    return Payload(etag=f'"search-v{catalog.version}-{digest}"', body=body)
+
+
+def encode_cursor(version: int, offset: int) -> str:
+    """Encode an opaque pagination cursor pinned to a catalog version."""
+    return base64.urlsafe_b64encode(f"{version}:{offset}".encode()).decode()
+
+
+def decode_cursor(cursor: str) -> tuple[int, int]:
+    """Decode a pagination cursor. Raises ValueError if malformed or negative."""
+    version, offset = base64.urlsafe_b64decode(cursor.encode()).decode().split(":")
+    version, offset = int(version), int(offset)
+    if version < 0 or offset < 0:
+        raise ValueError("negative cursor")
+    return version, offset
+
+
+def _etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    candidates = [tag.strip().removeprefix("W/") for tag in header.split(",")]
+    return "*" in candidates or etag in candidates
+
+
+def payload_response(request: Request, payload: Payload) -> Response:
+    """
+    Serve a payload honouring If-None-Match (304) and Accept-Encoding
+    (br, then gzip, when precompressed variants exist).
+    """
+    headers = {
+        "ETag": payload.etag,
+        "Cache-Control": "no-cache",
+        "Vary": "Accept-Encoding"
+    }
+
+    if _etag_matches(request, payload.etag):
+        return Response(status_code=304, headers=headers)
+
+    accepted = request.headers.get("accept-encoding", "")
+    body = payload.body
+    if payload.br_body is not None and "br" in accepted:
+        body = payload.br_body
+        headers["Content-Encoding"] = "br"
+    elif payload.gzip_body is not None and "gzip" in accepted:
+        body = payload.gzip_body
+        headers["Content-Encoding"] = "gzip"
+
+    return Response(content=body, media_type="application/json", headers=headers)
@@ -2,7 +2,11 @@
 TapQuote PDF Generator
 Creates professional invoice PDFs using ReportLab
 """
+import copy
+import hashlib
 import io
+import os
+from dataclasses import dataclass
 from datetime import datetime
 from reportlab.lib import colors
 from reportlab.lib.pagesizes import A4
@@ -10,15 +14,197 @@ from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.units import mm, inch
 from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, Image
 from reportlab.lib.enums import TA_CENTER, TA_RIGHT, TA_LEFT
+from reportlab.lib.utils import ImageReader
 
-from config import BUSINESS_NAME, BUSINESS_ADDRESS, BUSINESS_PHONE, BUSINESS_EMAIL, TAX_RATE
+from models import Quote
+from shared_cache import shared_cache
+from tenants import TenantConfig, get_tenant_config, subscribe
 
 
-def generate_pdf(quote_data: dict) -> bytes:
+@dataclass(frozen=True)
+class RenderAssets:
+    """Per-tenant styles and parsed header/footer flowables, reused across renders."""
+    fingerprint: str
+    styles: dict
+    header: tuple
+    footer: tuple
+    quote_info_style: TableStyle
+    items_table_style: TableStyle
+    totals_table_style: TableStyle
+
+
+_assets_cache: dict[str, RenderAssets] = {}
+
+
+def _invalidate_assets(tenant_id: str) -> None:
+    _assets_cache.pop(tenant_id, None)
+
+
+subscribe(_invalidate_assets)
+
+
+def _build_assets(tenant: TenantConfig) -> RenderAssets:
+    """Build the styles and header flowables for a tenant's current config."""
+    brand = colors.HexColor(tenant.brand_color)
+    
+    # Styles
+    base_styles = getSampleStyleSheet()
+    
+    # Custom styles
+    styles = {
+        "title": ParagraphStyle(
+            'CustomTitle',
+            parent=base_styles['Heading1'],
+            fontSize=24,
+            textColor=brand,
+            spaceAfter=10,
+            alignment=TA_CENTER
+        ),
+        "header": ParagraphStyle(
+            'HeaderStyle',
+            parent=base_styles['Normal'],
+            fontSize=10,
+            textColor=colors.HexColor('#666666'),
+            alignment=TA_CENTER
+        ),
+        "section": ParagraphStyle(
+            'SectionStyle',
+            parent=base_styles['Heading2'],
+            fontSize=14,
+            textColor=brand,
+            spaceBefore=15,
+            spaceAfter=10
+        ),
+        "normal": ParagraphStyle(
+            'NormalStyle',
+            parent=base_styles['Normal'],
+            fontSize=10,
+            textColor=colors.HexColor('#333333')
+        ),
+        "quote_title": ParagraphStyle(
+            'QuoteTitle',
+            parent=base_styles['Heading1'],
+            fontSize=20,
+            textColor=brand,
+            alignment=TA_LEFT
+        ),
+        "item_desc": ParagraphStyle('ItemDesc', fontSize=9),
+        "notes": ParagraphStyle(
+            'Notes',
+            parent=base_styles['Normal'],
+            fontSize=8,
+            textColor=colors.HexColor('#666666')
+        ),
+        "terms_header": ParagraphStyle(
+            'TermsHeader',
+            parent=base_styles['Normal'],
+            fontSize=9,
+            textColor=colors.HexColor('#333333'),
+            fontName='Helvetica-Bold'
+        ),
+    }
+    
+    # Header - Business Info (parsed once, copied per render)
+    header = []
+    if tenant.logo_path and os.path.exists(tenant.logo_path):
+        logo = ImageReader(tenant.logo_path)
+        width, height = logo.getSize()
+        header.append(Image(logo, width=40*mm, height=40*mm * height / width))
+    header.append(Paragraph(tenant.business_name, styles["title"]))
+    header.append(Paragraph(tenant.business_address, styles["header"]))
+    header.append(Paragraph(f"{tenant.business_phone} | {tenant.business_email}", styles["header"]))
+    
+    footer = (
+        Paragraph("Terms & Conditions:", styles["terms_header"]),
+        Paragraph(
+            "• This quote is valid for 30 days from the date of issue.<br/>"
+            "• Payment terms: 50% deposit, balance on completion.<br/>"
+            "• All work is guaranteed for 12 months.<br/>"
+            "• Prices include GST.",
+            styles["notes"]
+        ),
+    )
+    
+    quote_info_style = TableStyle([
+        ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
+        ('FONTNAME', (1, 0), (1, -1), 'Helvetica'),
+        ('FONTSIZE', (0, 0), (-1, -1), 10),
+        ('TEXTCOLOR', (0, 0), (-1, -1), colors.HexColor('#333333')),
+        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+        ('BOTTOMPADDING', (0, 0), (-1, -1), 5),
+    ])
+    
+    items_table_style = TableStyle([
+        # Header row
+        ('BACKGROUND', (0, 0), (-1, 0), brand),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, 0), 10),
+        ('ALIGN', (0, 0), (-1, 0), 'CENTER'),
+        ('BOTTOMPADDING', (0, 0), (-1, 0), 10),
+        ('TOPPADDING', (0, 0), (-1, 0), 10),
+        
+        # Data rows
+        ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
+        ('FONTSIZE', (0, 1), (-1, -1), 9),
+        ('ALIGN', (1, 1), (-1, -1), 'RIGHT'),
+        ('ALIGN', (0, 1), (0, -1), 'LEFT'),
+        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+        ('BOTTOMPADDING', (0, 1), (-1, -1), 8),
+        ('TOPPADDING', (0, 1), (-1, -1), 8),
+        
+        # Alternating row colors
+        ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#f5f5f5')]),
+        
+        # Grid
+        ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor('#cccccc')),
+        ('BOX', (0, 0), (-1, -1), 1, brand),
+    ])
+    
+    totals_table_style = TableStyle([
+        ('FONTNAME', (0, 0), (-1, -1), 'Helvetica'),
+        ('FONTSIZE', (0, 0), (-1, -1), 10),
+        ('ALIGN', (3, 0), (-1, -1), 'RIGHT'),
+        ('FONTNAME', (3, -1), (-1, -1), 'Helvetica-Bold'),
+        ('FONTSIZE', (3, -1), (-1, -1), 12),
+        ('TEXTCOLOR', (3, -1), (-1, -1), brand),
+        ('TOPPADDING', (0, 0), (-1, -1), 5),
+        ('BOTTOMPADDING', (0, 0), (-1, -1), 5),
+        ('LINEABOVE', (3, -1), (-1, -1), 2, brand),
+    ])
+    
+    return RenderAssets(
+        fingerprint=tenant.fingerprint,
+        styles=styles,
+        header=tuple(header),
+        footer=footer,
+        quote_info_style=quote_info_style,
+        items_table_style=items_table_style,
+        totals_table_style=totals_table_style
+    )
+
+
+def get_render_assets(tenant: TenantConfig) -> RenderAssets:
+    """
+    Return cached render assets for the tenant's current config.
+    Checked by content fingerprint: export workers get no change notifications.
+    """
+    assets = _assets_cache.get(tenant.tenant_id)
+    if assets is None or assets.fingerprint != tenant.fingerprint:
+        assets = _build_assets(tenant)
+        _assets_cache[tenant.tenant_id] = assets
+    return assets
+
+
+def generate_pdf(quote: Quote, tenant: TenantConfig | None = None) -> bytes:
     """
-    Generate a professional PDF invoice from quote data.
+    Generate a professional PDF invoice from a validated quote.
     Returns PDF as bytes.
     """
+    tenant = tenant or get_tenant_config()
+    assets = get_render_assets(tenant)
+    styles = assets.styles
+    
     buffer = io.BytesIO()
     
     # Create document
@@ -31,90 +217,38 @@ def generate_pdf(quote_data: dict) -> bytes:
         bottomMargin=20*mm
     )
     
-    # Styles
-    styles = getSampleStyleSheet()
-    
-    # Custom styles
-    title_style = ParagraphStyle(
-        'CustomTitle',
-        parent=styles['Heading1'],
-        fontSize=24,
-        textColor=colors.HexColor('#1e3a5f'),
-        spaceAfter=10,
-        alignment=TA_CENTER
-    )
-    
-    header_style = ParagraphStyle(
-        'HeaderStyle',
-        parent=styles['Normal'],
-        fontSize=10,
-        textColor=colors.HexColor('#666666'),
-        alignment=TA_CENTER
-    )
-    
-    section_style = ParagraphStyle(
-        'SectionStyle',
-        parent=styles['Heading2'],
-        fontSize=14,
-        textColor=colors.HexColor('#1e3a5f'),
-        spaceBefore=15,
-        spaceAfter=10
-    )
-    
-    normal_style = ParagraphStyle(
-        'NormalStyle',
-        parent=styles['Normal'],
-        fontSize=10,
-        textColor=colors.HexColor('#333333')
-    )
-    
     # Build content
     content = []
     
-    # Header - Business Info
-    content.append(Paragraph(BUSINESS_NAME, title_style))
-    content.append(Paragraph(BUSINESS_ADDRESS, header_style))
-    content.append(Paragraph(f"{BUSINESS_PHONE} | {BUSINESS_EMAIL}", header_style))
+    # Header - Business Info (flowables are copied since layout mutates them)
+    content.extend(copy.copy(flowable) for flowable in assets.header)
     content.append(Spacer(1, 15*mm))
     
     # Quote Title & Number
     quote_number = f"Q-{datetime.now().strftime('%Y%m%d%H%M%S')}"
     quote_date = datetime.now().strftime("%d %B %Y")
     
-    content.append(Paragraph("QUOTE", ParagraphStyle(
-        'QuoteTitle',
-        parent=styles['Heading1'],
-        fontSize=20,
-        textColor=colors.HexColor('#1e3a5f'),
-        alignment=TA_LEFT
-    )))
+    content.append(Paragraph("QUOTE", styles["quote_title"]))
     
     # Quote details table
     quote_info = [
         ["Quote Number:", quote_number],
         ["Date:", quote_date],
-        ["Customer:", quote_data.get("customer_name", "Customer")],
+        ["Customer:", quote.customer_name],
     ]
     
     quote_info_table = Table(quote_info, colWidths=[80, 200])
-    quote_info_table.setStyle(TableStyle([
-        ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
-        ('FONTNAME', (1, 0), (1, -1), 'Helvetica'),
-        ('FONTSIZE', (0, 0), (-1, -1), 10),
-        ('TEXTCOLOR', (0, 0), (-1, -1), colors.HexColor('#333333')),
-        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 5),
-    ]))
+    quote_info_table.setStyle(assets.quote_info_style)
     content.append(quote_info_table)
     content.append(Spacer(1, 10*mm))
     
     # Job Summary
-    content.append(Paragraph("Job Summary", section_style))
-    content.append(Paragraph(quote_data.get("job_summary", "N/A"), normal_style))
+    content.append(Paragraph("Job Summary", styles["section"]))
+    content.append(Paragraph(quote.job_summary or "N/A", styles["normal"]))
     content.append(Spacer(1, 10*mm))
     
     # Line Items Table
-    content.append(Paragraph("Quote Details", section_style))
+    content.append(Paragraph("Quote Details", styles["section"]))
     
     # Table header
     table_data = [
@@ -122,109 +256,50 @@ def generate_pdf(quote_data: dict) -> bytes:
     ]
     
     # Add items
-    items = quote_data.get("items", [])
-    for item in items:
-        description = item.get("description", "")
-        if item.get("is_estimate", False):
+    for item in quote.items:
+        description = item.description
+        if item.is_estimate:
             description += " *"
         
         table_data.append([
-            Paragraph(description, ParagraphStyle('ItemDesc', fontSize=9)),
-            str(item.get("qty", 1)),
-            f"${item.get('unit_material_cost', 0):.2f}",
-            f"${item.get('labor_cost', 0):.2f}",
-            f"${item.get('line_total', 0):.2f}"
+            Paragraph(description, styles["item_desc"]),
+            str(item.qty),
+            f"${item.unit_material_cost:.2f}",
+            f"${item.labor_cost:.2f}",
+            f"${item.line_total:.2f}"
         ])
     
     # Create table
     col_widths = [250, 40, 70, 70, 70]
     items_table = Table(table_data, colWidths=col_widths)
     
-    items_table.setStyle(TableStyle([
-        # Header row
-        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#1e3a5f')),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, 0), 10),
-        ('ALIGN', (0, 0), (-1, 0), 'CENTER'),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 10),
-        ('TOPPADDING', (0, 0), (-1, 0), 10),
-        
-        # Data rows
-        ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
-        ('FONTSIZE', (0, 1), (-1, -1), 9),
-        ('ALIGN', (1, 1), (-1, -1), 'RIGHT'),
-        ('ALIGN', (0, 1), (0, -1), 'LEFT'),
-        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-        ('BOTTOMPADDING', (0, 1), (-1, -1), 8),
-        ('TOPPADDING', (0, 1), (-1, -1), 8),
-        
-        # Alternating row colors
-        ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#f5f5f5')]),
-        
-        # Grid
-        ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor('#cccccc')),
-        ('BOX', (0, 0), (-1, -1), 1, colors.HexColor('#1e3a5f')),
-    ]))
+    items_table.setStyle(assets.items_table_style)
     
     content.append(items_table)
     content.append(Spacer(1, 5*mm))
     
     # Totals section
-    subtotal = quote_data.get("subtotal", 0)
-    tax = quote_data.get("tax", 0)
-    grand_total = quote_data.get("grand_total", 0)
-    
     totals_data = [
-        ["", "", "", "Subtotal:", f"${subtotal:.2f}"],
-        ["", "", "", f"GST ({TAX_RATE}%):", f"${tax:.2f}"],
-        ["", "", "", "TOTAL:", f"${grand_total:.2f}"],
+        ["", "", "", "Subtotal:", f"${quote.subtotal:.2f}"],
+        ["", "", "", f"GST ({tenant.tax_rate}%):", f"${quote.tax:.2f}"],
+        ["", "", "", "TOTAL:", f"${quote.grand_total:.2f}"],
     ]
     
     totals_table = Table(totals_data, colWidths=col_widths)
-    totals_table.setStyle(TableStyle([
-        ('FONTNAME', (0, 0), (-1, -1), 'Helvetica'),
-        ('FONTSIZE', (0, 0), (-1, -1), 10),
-        ('ALIGN', (3, 0), (-1, -1), 'RIGHT'),
-        ('FONTNAME', (3, -1), (-1, -1), 'Helvetica-Bold'),
-        ('FONTSIZE', (3, -1), (-1, -1), 12),
-        ('TEXTCOLOR', (3, -1), (-1, -1), colors.HexColor('#1e3a5f')),
-        ('TOPPADDING', (0, 0), (-1, -1), 5),
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 5),
-        ('LINEABOVE', (3, -1), (-1, -1), 2, colors.HexColor('#1e3a5f')),
-    ]))
+    totals_table.setStyle(assets.totals_table_style)
     
     content.append(totals_table)
     content.append(Spacer(1, 15*mm))
     
     # Footer notes
-    notes_style = ParagraphStyle(
-        'Notes',
-        parent=styles['Normal'],
-        fontSize=8,
-        textColor=colors.HexColor('#666666')
-    )
     
     # Check if any estimates
-    has_estimates = any(item.get("is_estimate", False) for item in items)
+    has_estimates = any(item.is_estimate for item in quote.items)
     if has_estimates:
-        content.append(Paragraph("* Marked items are estimates only. Actual prices may vary.", notes_style))
+        content.append(Paragraph("* Marked items are estimates only. Actual prices may vary.", styles["notes"]))
         content.append(Spacer(1, 3*mm))
     
-    content.append(Paragraph("Terms & Conditions:", ParagraphStyle(
-        'TermsHeader',
-        parent=styles['Normal'],
-        fontSize=9,
-        textColor=colors.HexColor('#333333'),
-        fontName='Helvetica-Bold'
-    )))
-    content.append(Paragraph(
-        "• This quote is valid for 30 days from the date of issue.<br/>"
-        "• Payment terms: 50% deposit, balance on completion.<br/>"
-        "• All work is guaranteed for 12 months.<br/>"
-        "• Prices include GST.",
-        notes_style
-    ))
+    content.extend(copy.copy(flowable) for flowable in assets.footer)
     
     # Build PDF
     doc.build(content)
@@ -235,11 +310,38 @@ def generate_pdf(quote_data: dict) -> bytes:
     return pdf_bytes
 
 
-def save_pdf_to_file(quote_data: dict, filepath: str) -> str:
+def pdf_cache_key(quote: Quote, tenant: TenantConfig) -> str:
+    """
+    Shared cache key for a rendered quote: its content, the tenant config
+    fingerprint and the issue date printed on the PDF.
+    """
+    digest = hashlib.blake2b(quote.model_dump_json().encode("utf-8"), digest_size=16).hexdigest()
+    return f"{tenant.tenant_id}:{tenant.fingerprint}:{datetime.now().strftime('%Y%m%d')}:{digest}"
+
+
+def get_or_render_pdf(quote: Quote, tenant: TenantConfig | None = None) -> tuple[bytes, bool]:
+    """
+    Return the PDF for a quote from the shared cache (populated by any
+    worker), rendering and storing it on a miss. Also returns whether it
+    was a cache hit.
+    """
+    tenant = tenant or get_tenant_config()
+    key = pdf_cache_key(quote, tenant)
+    
+    pdf_bytes = shared_cache.get("pdf", key)
+    if pdf_bytes is not None:
+        return pdf_bytes, True
+    
+    pdf_bytes = generate_pdf(quote, tenant)
+    shared_cache.put("pdf", key, pdf_bytes)
+    return pdf_bytes, False
+
+
+def save_pdf_to_file(quote: Quote, filepath: str, tenant: TenantConfig | None = None) -> str:
     """
     Generate PDF and save to file.
     """
-    pdf_bytes = generate_pdf(quote_data)
+    pdf_bytes = generate_pdf(quote, tenant)
     
     with open(filepath, 'wb') as f:
         f.write(pdf_bytes)
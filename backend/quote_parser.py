@@ -0,0 +1,201 @@
+"""
+TapQuote Quote Parser
+Turns LLM output into a Quote: local repair of near-miss JSON (truncation,
+trailing commas, stray text), per-item validation so only broken items need
+regenerating, and parse-failure counters
+"""
+import json
+import threading
+from dataclasses import dataclass, field
+
+from pydantic import ValidationError
+
+from models import LLMQuoteItem, QuoteItem
+
+
+class QuoteParseError(ValueError):
+    """Raised when the LLM response cannot be parsed into a Quote."""
+    
+    def __init__(self, message: str, raw_response: str):
+        super().__init__(message)
+        self.raw_response = raw_response
+
+
+MAX_TRUNCATION_ATTEMPTS = 64
+
+
+def _close_json(text: str) -> tuple[str, list[int]]:
+    """
+    Single pass over (possibly truncated) JSON: drop trailing commas,
+    stop at the end of the first top-level value, and close any open
+    string/array/object. Also returns the offsets of structural commas in
+    text (not in the output, which drops characters), which are safe places
+    to cut a truncated tail.
+    """
+    out = []
+    stack = []
+    commas = []
+    in_string = False
+    escaped = False
+    
+    for offset, char in enumerate(text):
+        if in_string:
+            out.append(char)
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+            continue
+        
+        if char == '"':
+            in_string = True
+        elif char in "{[":
+            stack.append("}" if char == "{" else "]")
+        elif char in "}]":
+            # Trailing comma before a closer
+            while out and out[-1].isspace():
+                out.pop()
+            if out and out[-1] == ",":
+                out.pop()
+            if not stack:
+                break
+            stack.pop()
+            out.append(char)
+            if not stack:
+                break
+            continue
+        elif char == ",":
+            commas.append(offset)
+        out.append(char)
+    
+    if in_string:
+        if escaped:
+            out.pop()
+        out.append('"')
+    
+    # Drop a dangling separator or key with no value before closing
+    closed = "".join(out).rstrip()
+    while closed and closed[-1] in ",:":
+        closed = closed[:-1].rstrip()
+        if closed.endswith('"') and stack and stack[-1] == "}":
+            # A bare key: remove it too
+            start = closed.rfind('"', 0, len(closed) - 1)
+            closed = closed[:start].rstrip()
+    
+    return closed + "".join(reversed(stack)), commas
+
+
+def repair_json(text: str) -> dict:
+    """
+    Recover a JSON object from near-miss LLM output without another call.
+    Raises ValueError if nothing parseable can be recovered.
+    """
+    start = text.find("{")
+    if start == -1:
+        raise ValueError("no JSON object found")
+    text = text[start:]
+    
+    candidate, commas = _close_json(text)
+    try:
+        return json.loads(candidate)
+    except json.JSONDecodeError:
+        pass
+    
+    # Truncated mid-element: cut back to earlier commas until it parses
+    for cut in reversed(commas[-MAX_TRUNCATION_ATTEMPTS:]):
+        candidate, _ = _close_json(text[:cut])
+        try:
+            return json.loads(candidate)
+        except json.JSONDecodeError:
+            continue
+    
+    raise ValueError("could not repair JSON")
+
+
+@dataclass
+class ParsedQuote:
+    """A quote payload with its items validated one by one."""
+    data: dict
+    items: list[QuoteItem | None]
+    failed: list[tuple[int, object, str]] = field(default_factory=list)
+    incomplete: list[int] = field(default_factory=list)
+    repaired: bool = False
+
+
+def parse_quote_payload(payload: dict | str) -> ParsedQuote:
+    """
+    Parse an LLM quote payload (tool-call args or free text).
+    Items that fail validation are collected in .failed instead of
+    failing the whole quote; items missing labor_cost/line_total (e.g. cut
+    off by truncation) are listed in .incomplete for local recalculation.
+    Raises QuoteParseError if no line items can be recovered.
+    """
+    repaired = False
+    if isinstance(payload, str):
+        try:
+            data = json.loads(payload)
+        except json.JSONDecodeError:
+            try:
+                data = repair_json(payload)
+            except ValueError as e:
+                raise QuoteParseError(f"Failed to parse quote: {e}", payload) from e
+            repaired = True
+    else:
+        data = payload
+    
+    if not isinstance(data, dict):
+        raise QuoteParseError("Failed to parse quote: expected a JSON object", str(payload))
+    
+    raw_items = data.get("items")
+    if not isinstance(raw_items, list) or not raw_items:
+        # Includes output cut off right after "items": [ - an empty quote is not a quote
+        raise QuoteParseError("Failed to parse quote: no items", str(payload))
+    
+    items = []
+    failed = []
+    incomplete = []
+    for index, raw_item in enumerate(raw_items):
+        try:
+            # Server-owned fields in the output are ignored, not trusted
+            items.append(QuoteItem.from_llm(LLMQuoteItem.model_validate(raw_item)))
+        except ValidationError as e:
+            items.append(None)
+            failed.append((index, raw_item, str(e)))
+            continue
+        if not ("labor_cost" in raw_item and "line_total" in raw_item):
+            incomplete.append(index)
+    
+    return ParsedQuote(data=data, items=items, failed=failed, incomplete=incomplete, repaired=repaired)
+
+
+class ParseStats:
+    """Counters for how LLM quote output was recovered."""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts = {
+            "responses": 0,
+            "clean": 0,
+            "repaired_locally": 0,
+            "item_retry": 0,
+            "failed": 0,
+        }
+    
+    def record(self, outcome: str) -> None:
+        """Count one response by how it was recovered: clean, repaired_locally, item_retry or failed."""
+        with self._lock:
+            self.counts["responses"] += 1
+            self.counts[outcome] += 1
+    
+    def snapshot(self) -> dict:
+        with self._lock:
+            counts = dict(self.counts)
+        responses = counts["responses"] or 1
+        counts["parse_failure_rate"] = round((counts["responses"] - counts["clean"]) / responses, 4)
+        counts["unrecovered_rate"] = round(counts["failed"] / responses, 4)
+        return counts
+
+
+parse_stats = ParseStats()
@@ -0,0 +1,121 @@
+"""
+TapQuote Quote Store
+Persists generated quotes in a local SQLite database so they can be
+exported (and analysed) later by ID
+"""
+import os
+import sqlite3
+import uuid
+from datetime import datetime, timezone
+
+from config import QUOTES_DB
+from models import Quote
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS quotes (
+    id TEXT PRIMARY KEY,
+    tenant_id TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    quote_json TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS quotes_tenant_created ON quotes (tenant_id, created_at);
+"""
+
+_initialized = False
+
+
+def _connect() -> sqlite3.Connection:
+    """Open a connection, creating the database on first use."""
+    global _initialized
+    
+    if not _initialized:
+        os.makedirs(os.path.dirname(QUOTES_DB) or ".", exist_ok=True)
+    conn = sqlite3.connect(QUOTES_DB, timeout=10)
+    if not _initialized:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(_SCHEMA)
+        _initialized = True
+    return conn
+
+
+def save_quote(quote: Quote, tenant_id: str) -> str:
+    """Store a quote and return its ID."""
+    quote_id = f"Q-{uuid.uuid4().hex[:12]}"
+    created_at = datetime.now(timezone.utc).isoformat()
+    
+    conn = _connect()
+    try:
+        with conn:
+            conn.execute(
+                "INSERT INTO quotes (id, tenant_id, created_at, quote_json) VALUES (?, ?, ?, ?)",
+                (quote_id, tenant_id, created_at, quote.model_dump_json())
+            )
+    finally:
+        conn.close()
+    return quote_id
+
+
+def get_quotes(quote_ids: list[str], tenant_id: str) -> dict[str, Quote]:
+    """
+    Load stored quotes by ID for a tenant.
+    IDs that don't exist (or belong to another tenant) are omitted.
+    """
+    if not quote_ids:
+        return {}
+    
+    placeholders = ",".join("?" * len(quote_ids))
+    conn = _connect()
+    try:
+        rows = conn.execute(
+            f"SELECT id, quote_json FROM quotes WHERE tenant_id = ? AND id IN ({placeholders})",
+            (tenant_id, *quote_ids)
+        ).fetchall()
+    finally:
+        conn.close()
+    
+    return {quote_id: Quote.model_validate_json(quote_json) for quote_id, quote_json in rows}
+
+
+def list_quotes(tenant_id: str | None = None, since: str | None = None, until: str | None = None) -> list[tuple[str, str, Quote]]:
+    """
+    Return (id, tenant_id, quote) for stored quotes, oldest first.
+    since/until are ISO timestamps compared against created_at.
+    """
+    query = "SELECT id, tenant_id, quote_json FROM quotes WHERE 1 = 1"
+    params = []
+    if tenant_id is not None:
+        query += " AND tenant_id = ?"
+        params.append(tenant_id)
+    if since is not None:
+        query += " AND created_at >= ?"
+        params.append(since)
+    if until is not None:
+        query += " AND created_at < ?"
+        params.append(until)
+    query += " ORDER BY created_at"
+    
+    conn = _connect()
+    try:
+        rows = conn.execute(query, params).fetchall()
+    finally:
+        conn.close()
+    
+    return [(quote_id, tenant, Quote.model_validate_json(quote_json)) for quote_id, tenant, quote_json in rows]
+
+
+def list_quotes_after(last_rowid: int = 0, limit: int = 10000) -> list[tuple[int, Quote]]:
+    """
+    Return (rowid, quote) for quotes stored after last_rowid, in insert order.
+    Lets consumers follow the store incrementally.
+    """
+    conn = _connect()
+    try:
+        rows = conn.execute(
+            "SELECT rowid, quote_json FROM quotes WHERE rowid > ? ORDER BY rowid LIMIT ?",
+            (last_rowid, limit)
+        ).fetchall()
+    finally:
+        conn.close()
+    
+    return [(rowid, Quote.model_validate_json(quote_json)) for rowid, quote_json in rows]
@@ -0,0 +1,179 @@
+"""
+TapQuote Semantic Retrieval
+Offline embeddings for the materials catalog: hashed character n-grams,
+stored as a memory-mapped float32 matrix, searched brute force and fused
+with the keyword score. N-grams match spelling variants and run-together
+words ("powerpoint", "downlites"), not synonyms that share no letters
+("bathroom extractor" -> exhaust fan would need a learned model).
+"""
+import hashlib
+import os
+import re
+import threading
+import zlib
+
+import numpy as np
+
+from config import DATA_DIR, SEMANTIC_WEIGHT, SEMANTIC_MIN_SCORE
+from materials import CatalogSnapshot, search_materials
+
+
+EMBEDDING_DIM = 512
+NGRAM_SIZES = (3, 4)
+INDEX_DIR = os.path.join(DATA_DIR, "embeddings")
+KEEP_INDEX_FILES = 4
+
+_TOKEN_RE = re.compile(r"[a-z0-9.]+")
+
+
+def embed(text: str) -> np.ndarray:
+    """
+    Embed text as an L2-normalised bag of hashed word and character n-gram
+    features. Deterministic and local: no model download, no network.
+    """
+    vector = np.zeros(EMBEDDING_DIM, dtype=np.float32)
+    for token in _TOKEN_RE.findall(text.lower()):
+        features = [f"w:{token}"]
+        padded = f"#{token}#"
+        for size in NGRAM_SIZES:
+            features.extend(padded[i:i + size] for i in range(len(padded) - size + 1))
+        for feature in features:
+            digest = zlib.crc32(feature.encode("utf-8"))
+            # Low bits pick the slot, one high bit the sign (limits collision bias)
+            vector[digest % EMBEDDING_DIM] += 1.0 if digest & 0x80000000 else -1.0
+
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def material_text(material: dict) -> str:
+    """The text a material is embedded from."""
+    return " ".join([material["name"], material["category"], *material["keywords"]])
+
+
+class SemanticIndex:
+    """Row-per-material embedding matrix for one catalog snapshot."""
+
+    def __init__(self, ids: list[str], texts: list[str], matrix: np.ndarray):
+        self.ids = ids
+        self.texts = dict(zip(ids, texts))
+        self.matrix = matrix
+
+    def search(self, query: str, k: int = 10) -> list[tuple[str, float]]:
+        """Top-k (material_id, cosine similarity) for a query."""
+        if not self.ids:
+            return []
+        scores = self.matrix @ embed(query)
+        k = min(k, len(self.ids))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(self.ids[i], float(scores[i])) for i in top]
+
+
+def _prune_index_files() -> None:
+    """
+    Delete all but the most recent index files (open maps stay valid).
+    Other workers prune the same directory, so files can vanish mid-way.
+    """
+    dated = []
+    for name in os.listdir(INDEX_DIR):
+        if not (name.startswith("catalog-") and name.endswith(".f32")):
+            continue
+        path = os.path.join(INDEX_DIR, name)
+        try:
+            dated.append((os.path.getmtime(path), path))
+        except FileNotFoundError:
+            continue
+    dated.sort(reverse=True)
+    for _, stale in dated[KEEP_INDEX_FILES:]:
+        try:
+            os.remove(stale)
+        except FileNotFoundError:
+            pass
+
+
+def _build_index(catalog: CatalogSnapshot, previous: SemanticIndex | None) -> SemanticIndex:
+    """
+    Build (or open) the memory-mapped index for a catalog snapshot.
+    Files are content-addressed, so any worker or restart with the same
+    catalog reuses them; rows for unchanged materials are copied from the
+    previous index instead of being re-embedded.
+    """
+    texts = [material_text(material) for material in catalog.materials]
+    ids = [material["id"] for material in catalog.materials]
+    fingerprint = hashlib.blake2b("\n".join(ids + texts).encode("utf-8"), digest_size=12).hexdigest()
+    path = os.path.join(INDEX_DIR, f"catalog-{fingerprint}-d{EMBEDDING_DIM}.f32")
+
+    if not os.path.exists(path) and ids:
+        os.makedirs(INDEX_DIR, exist_ok=True)
+        previous_rows = {}
+        if previous is not None:
+            previous_rows = {material_id: row for row, material_id in enumerate(previous.ids)}
+
+        # Write to a temp file and rename, so readers never see a partial index
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        matrix = np.memmap(tmp_path, dtype=np.float32, mode="w+", shape=(len(ids), EMBEDDING_DIM))
+        for row, (material_id, text) in enumerate(zip(ids, texts)):
+            if material_id in previous_rows and previous.texts.get(material_id) == text:
+                matrix[row] = previous.matrix[previous_rows[material_id]]
+            else:
+                matrix[row] = embed(text)
+        matrix.flush()
+        del matrix
+        os.replace(tmp_path, path)
+        _prune_index_files()
+
+    if not ids:
+        matrix = np.zeros((0, EMBEDDING_DIM), dtype=np.float32)
+    else:
+        matrix = np.memmap(path, dtype=np.float32, mode="r", shape=(len(ids), EMBEDDING_DIM))
+
+    return SemanticIndex(ids, texts, matrix)
+
+
+_indexes: dict[int, SemanticIndex] = {}
+_lock = threading.Lock()
+
+
+def get_semantic_index(catalog: CatalogSnapshot) -> SemanticIndex:
+    """Return the index for a catalog version, building it on first use."""
+    index = _indexes.get(catalog.version)
+    if index is not None:
+        return index
+
+    with _lock:
+        index = _indexes.get(catalog.version)
+        if index is None:
+            previous = next(iter(_indexes.values()), None)
+            index = _build_index(catalog, previous)
+            # Only the live version is kept
+            _indexes.clear()
+            _indexes[catalog.version] = index
+    return index
+
+
+def hybrid_search(query: str, catalog: CatalogSnapshot, limit: int = 10) -> list[dict]:
+    """
+    Fuse keyword and semantic retrieval.
+    Each candidate scores SEMANTIC_WEIGHT * cosine + (1 - SEMANTIC_WEIGHT) *
+    (keyword score / best keyword score); semantic-only candidates need a
+    cosine of at least SEMANTIC_MIN_SCORE.
+    """
+    keyword_results = search_materials(query, catalog)
+    best_keyword = keyword_results[0]["relevance_score"] if keyword_results else 1
+    keyword_scores = {m["id"]: m["relevance_score"] / best_keyword for m in keyword_results}
+
+    semantic_scores = dict(get_semantic_index(catalog).search(query, k=limit * 2))
+
+    fused = {}
+    for material_id in keyword_scores.keys() | semantic_scores.keys():
+        semantic = semantic_scores.get(material_id, 0.0)
+        if material_id not in keyword_scores and semantic < SEMANTIC_MIN_SCORE:
+            continue
+        fused[material_id] = SEMANTIC_WEIGHT * semantic + (1 - SEMANTIC_WEIGHT) * keyword_scores.get(material_id, 0.0)
+
+    ranked = sorted(fused.items(), key=lambda pair: pair[1], reverse=True)[:limit]
+    return [
+        {**catalog.by_id[material_id], "relevance_score": round(score, 4)}
+        for material_id, score in ranked
+    ]
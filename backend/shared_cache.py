@@ -0,0 +1,235 @@
+"""
+TapQuote Shared Cache
+A size-bounded key-value cache in local SQLite (WAL), shared by every
+uvicorn worker on the host, with per-worker hit/miss counters
+"""
+import atexit
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from config import SHARED_CACHE_DB, SHARED_CACHE_MAX_BYTES
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS cache (
+    key TEXT PRIMARY KEY,
+    namespace TEXT NOT NULL,
+    value BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    expires_at REAL,
+    last_access REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS cache_last_access ON cache (last_access);
+CREATE TABLE IF NOT EXISTS cache_meta (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO cache_meta VALUES ('bytes', (SELECT COALESCE(SUM(size), 0) FROM cache));
+CREATE TABLE IF NOT EXISTS cache_stats (
+    pid INTEGER NOT NULL,
+    namespace TEXT NOT NULL,
+    hits INTEGER NOT NULL,
+    misses INTEGER NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (pid, namespace)
+);
+"""
+
+STATS_FLUSH_INTERVAL = 1.0  # seconds
+TOUCH_INTERVAL = 60.0  # seconds; hits refresh last_access at most this often, so LRU order is this coarse
+
+_initialized = False
+_init_lock = threading.Lock()
+_local = threading.local()
+
+
+def _connect() -> sqlite3.Connection:
+    """
+    This thread's connection, opened (and the cache database created) on
+    first use. Connections are kept for the life of the thread and run in
+    autocommit mode; writers open their own BEGIN IMMEDIATE transactions.
+    """
+    global _initialized
+
+    conn = getattr(_local, "conn", None)
+    if conn is not None and _local.pid == os.getpid():
+        return conn
+
+    with _init_lock:
+        if not _initialized:
+            os.makedirs(os.path.dirname(SHARED_CACHE_DB) or ".", exist_ok=True)
+        conn = sqlite3.connect(SHARED_CACHE_DB, timeout=10, isolation_level=None)
+        conn.execute("PRAGMA synchronous=NORMAL")
+        if not _initialized:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+            _initialized = True
+    _local.conn = conn
+    _local.pid = os.getpid()
+    return conn
+
+
+@contextmanager
+def _write(conn: sqlite3.Connection):
+    """
+    A write transaction that takes the database write lock up front, so a
+    read-then-write never fails on a snapshot another worker moved past.
+    """
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
+
+
+class SharedCache:
+    """
+    LRU key-value cache in SQLite: entries are evicted by last access once
+    the total stored size passes max_bytes. The total is kept as a running
+    count in cache_meta, updated in the same transaction as each write.
+    Keys are namespaced ("pdf", "quote", ...) and hit/miss counts are kept
+    per worker process.
+
+    Hits are plain reads: last_access refreshes are queued and written in
+    one batch with the stats, and only for entries not touched within
+    TOUCH_INTERVAL.
+    """
+
+    def __init__(self, max_bytes: int = SHARED_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._counts: dict[str, list[int]] = {}
+        self._touches: dict[str, float] = {}
+        self._dirty = False
+        self._last_stats_flush = 0.0  # publish on first use, then every STATS_FLUSH_INTERVAL
+
+    def _count(self, namespace: str, hit: bool, touch: str | None = None) -> None:
+        with self._lock:
+            counts = self._counts.setdefault(namespace, [0, 0])
+            counts[0 if hit else 1] += 1
+            if touch is not None:
+                self._touches[touch] = time.time()
+            self._dirty = True
+            due = time.monotonic() - self._last_stats_flush >= STATS_FLUSH_INTERVAL
+        if due:
+            self.flush_stats()
+
+    def get(self, namespace: str, key: str) -> bytes | None:
+        """Return a cached value, or None. Its LRU position is refreshed in the next batch."""
+        full_key = f"{namespace}:{key}"
+        now = time.time()
+        conn = _connect()
+        row = conn.execute(
+            "SELECT value, expires_at, last_access FROM cache WHERE key = ?", (full_key,)
+        ).fetchone()
+        if row is not None and row[1] is not None and row[1] < now:
+            # Re-checked under the write lock: another worker may have replaced it
+            with _write(conn):
+                expired = conn.execute(
+                    "SELECT size FROM cache WHERE key = ? AND expires_at < ?", (full_key, now)
+                ).fetchone()
+                if expired is not None:
+                    conn.execute("DELETE FROM cache WHERE key = ?", (full_key,))
+                    conn.execute("UPDATE cache_meta SET value = value - ? WHERE name = 'bytes'", (expired[0],))
+            row = None
+
+        stale = row is not None and now - row[2] >= TOUCH_INTERVAL
+        self._count(namespace, row is not None, full_key if stale else None)
+        return row[0] if row is not None else None
+
+    def put(self, namespace: str, key: str, value: bytes, ttl: float | None = None) -> None:
+        """Store a value, then evict least recently used entries over max_bytes."""
+        if len(value) > self.max_bytes:
+            return
+
+        full_key = f"{namespace}:{key}"
+        now = time.time()
+        conn = _connect()
+        with _write(conn):
+            previous = conn.execute("SELECT size FROM cache WHERE key = ?", (full_key,)).fetchone()
+            conn.execute(
+                "INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?, ?, ?)",
+                (full_key, namespace, value, len(value), now + ttl if ttl else None, now)
+            )
+            conn.execute(
+                "UPDATE cache_meta SET value = value + ? WHERE name = 'bytes'",
+                (len(value) - (previous[0] if previous else 0),)
+            )
+            total = conn.execute("SELECT value FROM cache_meta WHERE name = 'bytes'").fetchone()[0]
+            excess = total - self.max_bytes
+            if excess > 0:
+                evict = []
+                freed = 0
+                for evict_key, size in conn.execute("SELECT key, size FROM cache ORDER BY last_access"):
+                    evict.append((evict_key,))
+                    freed += size
+                    if freed >= excess:
+                        break
+                conn.executemany("DELETE FROM cache WHERE key = ?", evict)
+                conn.execute("UPDATE cache_meta SET value = value - ? WHERE name = 'bytes'", (freed,))
+
+    def flush_stats(self) -> None:
+        """Publish this worker's hit/miss counters and write its queued LRU touches."""
+        with self._lock:
+            if not self._dirty:
+                return
+            counts = {namespace: tuple(values) for namespace, values in self._counts.items()}
+            touches, self._touches = self._touches, {}
+            self._dirty = False
+            self._last_stats_flush = time.monotonic()
+
+        now = time.time()
+        conn = _connect()
+        with _write(conn):
+            conn.executemany(
+                "INSERT OR REPLACE INTO cache_stats VALUES (?, ?, ?, ?, ?)",
+                [(os.getpid(), namespace, hits, misses, now) for namespace, (hits, misses) in counts.items()]
+            )
+            conn.executemany(
+                "UPDATE cache SET last_access = MAX(last_access, ?) WHERE key = ?",
+                [(touched_at, full_key) for full_key, touched_at in touches.items()]
+            )
+
+    def stats(self) -> dict:
+        """Cache size and hit rates per worker process and namespace."""
+        self.flush_stats()
+        conn = _connect()
+        entries = conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+        size = conn.execute("SELECT value FROM cache_meta WHERE name = 'bytes'").fetchone()[0]
+        by_namespace = conn.execute(
+            "SELECT namespace, COUNT(*), SUM(size) FROM cache GROUP BY namespace ORDER BY namespace"
+        ).fetchall()
+        workers = conn.execute(
+            "SELECT pid, namespace, hits, misses, updated_at FROM cache_stats ORDER BY pid, namespace"
+        ).fetchall()
+
+        return {
+            "served_by": os.getpid(),
+            "entries": entries,
+            "bytes": size,
+            "max_bytes": self.max_bytes,
+            "namespaces": [
+                {"namespace": namespace, "entries": count, "bytes": total}
+                for namespace, count, total in by_namespace
+            ],
+            "workers": [
+                {
+                    "pid": pid,
+                    "namespace": namespace,
+                    "hits": hits,
+                    "misses": misses,
+                    "hit_rate": round(hits / (hits + misses), 4) if hits + misses else 0.0,
+                    "updated_at": updated_at,
+                }
+                for pid, namespace, hits, misses, updated_at in workers
+            ],
+        }
+
+
+shared_cache = SharedCache()
+atexit.register(shared_cache.flush_stats)
@@ -0,0 +1,215 @@
+"""
+TapQuote Tenant Configuration
+Per-tenant pricing and branding, looked up per request from a local JSON store
+"""
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, asdict, fields, replace
+from typing import Callable
+
+from reportlab.lib.utils import ImageReader
+
+try:
+    import fcntl
+except ImportError:  # Not available on Windows: updates are then only serialized per process
+    fcntl = None
+
+from config import (
+    LABOR_RATE, MATERIAL_MARKUP, TAX_RATE,
+    BUSINESS_NAME, BUSINESS_ADDRESS, BUSINESS_PHONE, BUSINESS_EMAIL,
+    TENANTS_FILE, TENANT_RELOAD_INTERVAL, TENANT_DAILY_LLM_BUDGET
+)
+
+
+DEFAULT_TENANT_ID = "default"
+BRAND_COLOR_PATTERN = r"^#[0-9A-Fa-f]{6}$"
+NON_NEGATIVE_FIELDS = ("labor_rate", "material_markup", "tax_rate", "daily_llm_budget")
+
+
+@dataclass(frozen=True)
+class TenantConfig:
+    """Immutable pricing and branding settings for one tenant."""
+    tenant_id: str
+    version: int = 0
+    labor_rate: float = LABOR_RATE
+    material_markup: float = MATERIAL_MARKUP
+    tax_rate: float = TAX_RATE
+    business_name: str = BUSINESS_NAME
+    business_address: str = BUSINESS_ADDRESS
+    business_phone: str = BUSINESS_PHONE
+    business_email: str = BUSINESS_EMAIL
+    brand_color: str = "#1e3a5f"
+    logo_path: str = ""
+    daily_llm_budget: float = TENANT_DAILY_LLM_BUDGET  # USD, 0 = unlimited
+    # Hash of the editable values: the cache key for anything derived from
+    # this config, since a hand edit of the store changes content, not version
+    fingerprint: str = ""
+
+
+# Fields a tenant may override (identity, version and fingerprint are managed here)
+EDITABLE_FIELDS = tuple(
+    f.name for f in fields(TenantConfig) if f.name not in ("tenant_id", "version", "fingerprint")
+)
+
+_lock = threading.Lock()
+_cache: dict[str, TenantConfig] = {}
+_store_mtime: float | None = None
+_last_checked = 0.0
+_listeners: list[Callable[[str], None]] = []
+
+
+def subscribe(listener: Callable[[str], None]) -> None:
+    """Register a callback invoked with the tenant_id whenever its config changes."""
+    _listeners.append(listener)
+
+
+def _notify(tenant_ids) -> None:
+    for tenant_id in tenant_ids:
+        for listener in _listeners:
+            listener(tenant_id)
+
+
+def _read_store() -> dict:
+    """Read raw tenant records from the store file."""
+    try:
+        with open(TENANTS_FILE, "r", encoding="utf-8") as f:
+            return json.load(f).get("tenants", {})
+    except FileNotFoundError:
+        return {}
+
+
+def _write_store(records: dict) -> None:
+    """Atomically replace the store file."""
+    os.makedirs(os.path.dirname(TENANTS_FILE) or ".", exist_ok=True)
+    tmp_path = f"{TENANTS_FILE}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"tenants": records}, f, indent=2)
+    os.replace(tmp_path, TENANTS_FILE)
+
+
+def _to_config(tenant_id: str, record: dict) -> TenantConfig:
+    values = {key: record[key] for key in EDITABLE_FIELDS if key in record}
+    config = TenantConfig(tenant_id=tenant_id, version=int(record.get("version", 0)), **values)
+    content = json.dumps([tenant_id] + [getattr(config, key) for key in EDITABLE_FIELDS])
+    return replace(config, fingerprint=hashlib.blake2b(content.encode("utf-8"), digest_size=8).hexdigest())
+
+
+@contextmanager
+def _store_lock():
+    """Serialize store read-modify-writes across worker processes."""
+    if fcntl is None:
+        yield
+        return
+    os.makedirs(os.path.dirname(TENANTS_FILE) or ".", exist_ok=True)
+    with open(f"{TENANTS_FILE}.lock", "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _reload_if_changed(force: bool = False) -> None:
+    """
+    Reload the store when its mtime changes (checked at most every
+    TENANT_RELOAD_INTERVAL seconds) and notify listeners of changed tenants.
+    """
+    global _cache, _store_mtime, _last_checked
+    
+    now = time.monotonic()
+    if not force and now - _last_checked < TENANT_RELOAD_INTERVAL:
+        return
+    _last_checked = now
+    
+    try:
+        mtime = os.stat(TENANTS_FILE).st_mtime
+    except FileNotFoundError:
+        mtime = None
+    
+    if not force and mtime == _store_mtime:
+        return
+    
+    with _lock:
+        records = _read_store()
+        _store_mtime = mtime
+        
+        loaded = {tenant_id: _to_config(tenant_id, record) for tenant_id, record in records.items()}
+        loaded.setdefault(DEFAULT_TENANT_ID, _to_config(DEFAULT_TENANT_ID, {}))
+        
+        changed = [
+            tenant_id for tenant_id in set(loaded) | set(_cache)
+            if loaded.get(tenant_id) != _cache.get(tenant_id)
+        ]
+        # Swap in a new dict: lock-free readers never see a half-filled one
+        _cache = loaded
+    
+    _notify(changed)
+
+
+def get_tenant_config(tenant_id: str | None = None) -> TenantConfig:
+    """
+    Return the config for a tenant from the in-process cache.
+    Raises KeyError for unknown tenants.
+    """
+    _reload_if_changed()
+    return _cache[tenant_id or DEFAULT_TENANT_ID]
+
+
+def _validate_changes(changes: dict) -> None:
+    """Reject values that would break pricing or PDF rendering. Raises ValueError."""
+    for key in NON_NEGATIVE_FIELDS:
+        if key in changes and float(changes[key]) < 0:
+            raise ValueError(f"{key} must not be negative")
+    
+    if "brand_color" in changes and not re.match(BRAND_COLOR_PATTERN, changes["brand_color"]):
+        raise ValueError("brand_color must be a #RRGGBB hex color")
+    
+    logo_path = changes.get("logo_path")
+    if logo_path:
+        try:
+            ImageReader(logo_path).getSize()
+        except Exception as e:
+            raise ValueError(f"logo_path is not a readable image: {logo_path}") from e
+
+
+def update_tenant_config(tenant_id: str, changes: dict) -> TenantConfig:
+    """
+    Create or update a tenant, bumping its version and persisting it.
+    Unknown fields or invalid values raise ValueError.
+    """
+    unknown = set(changes) - set(EDITABLE_FIELDS)
+    if unknown:
+        raise ValueError(f"Unknown tenant config fields: {', '.join(sorted(unknown))}")
+    _validate_changes(changes)
+    
+    with _lock, _store_lock():
+        records = _read_store()
+        current = records.get(tenant_id)
+        if current is None and tenant_id in _cache:
+            current = asdict(_cache[tenant_id])
+        
+        base = _to_config(tenant_id, current or {})
+        updated = replace(base, version=base.version + 1, **changes)
+        
+        record = asdict(updated)
+        record.pop("tenant_id")
+        record.pop("fingerprint")
+        records[tenant_id] = record
+        _write_store(records)
+    
+    _reload_if_changed(force=True)
+    return _cache[tenant_id]
+
+
+def list_tenants() -> list[TenantConfig]:
+    """Return all known tenant configs."""
+    _reload_if_changed()
+    return list(_cache.values())
+
+
+_reload_if_changed(force=True)
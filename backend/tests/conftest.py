@@ -0,0 +1,9 @@
+"""
+Test setup: point every local store (quotes, ledger, caches) at a
+throwaway data directory before any backend module reads its config
+"""
+import os
+import tempfile
+
+os.environ["DATA_DIR"] = tempfile.mkdtemp(prefix="tapquote-tests-")
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
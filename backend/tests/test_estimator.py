@@ -0,0 +1,92 @@
+"""
+Labor hour tests: task classification, learning from stored quotes, and
+apply_fixed_hours settling hours and totals on generated quotes
+"""
+import pytest
+
+from agent import apply_fixed_hours, generate_mock_quote
+from estimator import LaborEstimator, classify_task
+from models import Quote, QuoteItem
+from tenants import get_tenant_config
+
+
+@pytest.fixture
+def tenant():
+    return get_tenant_config()
+
+
+def make_quote(*items: QuoteItem) -> Quote:
+    return Quote(job_summary="Test job", items=list(items), subtotal=0.0, tax=0.0, grand_total=0.0)
+
+
+def gpo_item(**changes) -> QuoteItem:
+    fields = {"description": "Install double GPO", "sku": "CL-GPO-10A", "qty": 2, "unit_material_cost": 15.0}
+    return QuoteItem(**{**fields, **changes})
+
+
+@pytest.mark.parametrize("description, task_type", [
+    ("Replace circuit breaker in switchboard", "circuit_breaker"),
+    ("20A Circuit for pool pump (inc. breaker, 4mm cable 15m, isolator)", "circuit"),
+    ("Install outdoor isolator", "isolator"),
+    ("Install IP54 weatherproof GPO", "weatherproof_gpo"),
+    ("Paint the fence", None),
+])
+def test_classify_task(description, task_type):
+    assert classify_task(description) == task_type
+
+
+def test_llm_item_without_totals_is_priced_from_its_hours(tenant):
+    quote = apply_fixed_hours(make_quote(gpo_item(estimated_hours=1.0)), {}, LaborEstimator(), tenant)
+
+    item = quote.items[0]
+    assert item.hours_source == "llm"
+    assert item.labor_cost == round(1.0 * tenant.labor_rate, 2)
+    assert item.line_total == round(15.0 * 2 + item.labor_cost, 2)
+    assert quote.subtotal == item.line_total
+    assert quote.grand_total == round(quote.subtotal + quote.tax, 2)
+
+
+def test_fixed_hours_override_the_llm(tenant):
+    quote = make_quote(gpo_item(estimated_hours=3.0, labor_cost=255.0, line_total=285.0))
+
+    item = apply_fixed_hours(quote, {"CL-GPO-10A": 0.4}, LaborEstimator(), tenant).items[0]
+
+    assert item.hours_source == "fixed"
+    assert item.estimated_hours == 0.8
+    assert item.labor_cost == round(0.8 * tenant.labor_rate, 2)
+
+
+def test_missing_hours_fall_back_to_learned_then_typical(tenant):
+    estimator = LaborEstimator(min_samples=1)
+    estimator.add_quotes([make_quote(gpo_item(estimated_hours=1.2, hours_source="llm"))])
+    quote = make_quote(
+        gpo_item(),
+        QuoteItem(description="Install LED downlight", qty=4, unit_material_cost=30.0),
+        QuoteItem(description="Paint the fence", qty=1, unit_material_cost=0.0)
+    )
+
+    items = apply_fixed_hours(quote, {}, estimator, tenant).items
+
+    assert [(item.hours_source, item.estimated_hours) for item in items] == [
+        ("fixed", 1.2), ("default", 3.0), ("default", 1.0)
+    ]
+
+
+def test_estimator_learns_only_llm_hours():
+    estimator = LaborEstimator(min_samples=2)
+    estimator.add_quotes([
+        make_quote(gpo_item(estimated_hours=1.0, hours_source="llm")),
+        make_quote(gpo_item(estimated_hours=2.0, hours_source="llm")),
+        make_quote(gpo_item(estimated_hours=9.0, hours_source="fixed")),
+        make_quote(gpo_item(estimated_hours=9.0, hours_source="default")),
+    ])
+
+    assert estimator.hours_per_unit("CL-GPO-10A") == 0.75
+    assert estimator.hours_per_unit(description="Replace a power point") == 0.75
+
+
+def test_mock_quotes_are_not_learned_from():
+    estimator = LaborEstimator(min_samples=1)
+    estimator.add_quotes([generate_mock_quote("Install 4 downlights and a GPO", "Bob")])
+
+    assert estimator.known_estimates() == {}
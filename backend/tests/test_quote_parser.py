@@ -0,0 +1,208 @@
+"""
+Quote parsing tests: local JSON repair, and generate_quote end to end
+against a stub LLM that returns clean, malformed and garbage output
+"""
+import asyncio
+import json
+
+import pytest
+from langchain_core.messages import AIMessage
+from langchain_core.output_parsers.openai_tools import make_invalid_tool_call, parse_tool_call
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_openai import ChatOpenAI
+
+import agent
+from quote_parser import ParseStats, QuoteParseError, parse_quote_payload, repair_json
+
+
+GPO_ITEM = {
+    "description": "Install double GPO",
+    "sku": "CL-GPO-10A",
+    "qty": 2,
+    "unit_material_cost": 15.0,
+    "estimated_hours": 1.0,
+    "labor_cost": 85.0,
+    "line_total": 115.0,
+    "is_estimate": False
+}
+DOWNLIGHT_ITEM = {**GPO_ITEM, "description": "Install LED downlight", "sku": "LED-DL-10W"}
+QUOTE = {
+    "customer_name": "Bob",
+    "job_summary": "GPOs and a downlight",
+    "items": [GPO_ITEM, DOWNLIGHT_ITEM],
+    "subtotal": 230.0,
+    "tax": 23.0,
+    "grand_total": 253.0
+}
+
+
+# (tool name or None for plain text, output) pairs, consumed one per LLM call
+SCRIPT: list[tuple[str | None, dict | str]] = []
+
+
+class StubLLM(ChatOpenAI):
+    """ChatOpenAI that replays SCRIPT instead of calling the API."""
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        tool_name, output = SCRIPT.pop(0)
+        usage = {"input_tokens": 100, "output_tokens": 50, "total_tokens": 150}
+
+        if tool_name is None:
+            message = AIMessage(content=output, usage_metadata=usage)
+        else:
+            raw_call = {
+                "id": "call_1",
+                "type": "function",
+                "function": {
+                    "name": tool_name,
+                    "arguments": output if isinstance(output, str) else json.dumps(output)
+                }
+            }
+            message = AIMessage(content="", additional_kwargs={"tool_calls": [raw_call]}, usage_metadata=usage)
+            try:
+                message.tool_calls = [parse_tool_call(raw_call, return_id=True)]
+            except Exception as e:
+                message.invalid_tool_calls = [make_invalid_tool_call(raw_call, str(e))]
+
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+
+@pytest.fixture
+def llm_script(monkeypatch):
+    """Script the stub LLM's responses; returns the list to fill and fresh parse stats."""
+    SCRIPT.clear()
+    stats = ParseStats()
+    monkeypatch.setattr(agent, "ChatOpenAI", lambda **kwargs: StubLLM(api_key="test-key", model=kwargs["model"]))
+    monkeypatch.setattr(agent, "parse_stats", stats)
+    yield SCRIPT, stats
+    SCRIPT.clear()
+
+
+def generate():
+    return asyncio.run(agent.generate_quote("Install 2 GPOs and a downlight", "Bob"))
+
+
+def truncated_quote() -> str:
+    """QUOTE as JSON, cut off partway through the second item."""
+    text = json.dumps(QUOTE)
+    return text[:text.index('"estimated_hours"', text.index("Install LED"))]
+
+
+def test_repair_json_truncated_array():
+    data = repair_json(truncated_quote())
+
+    assert data["items"][0] == GPO_ITEM
+    assert data["items"][1] == {
+        "description": "Install LED downlight", "sku": "LED-DL-10W", "qty": 2, "unit_material_cost": 15.0
+    }
+
+
+def test_repair_json_trailing_commas_and_stray_text():
+    text = 'Here is the quote: {"items": [{"description": "GPO", "unit_material_cost": 10,},], "subtotal": 10,} Thanks!'
+
+    assert repair_json(text) == {"items": [{"description": "GPO", "unit_material_cost": 10}], "subtotal": 10}
+
+
+def test_parse_payload_rejects_empty_items():
+    with pytest.raises(QuoteParseError):
+        parse_quote_payload('{"customer_name": "Bob", "items": [')
+
+
+def test_clean_tool_call(llm_script):
+    script, stats = llm_script
+    script.append(("Quote", QUOTE))
+
+    quote = generate()
+
+    assert [item.sku for item in quote.items] == ["CL-GPO-10A", "LED-DL-10W"]
+    assert stats.snapshot()["clean"] == 1
+
+
+def test_truncated_tool_call_is_repaired_locally(llm_script):
+    script, stats = llm_script
+    script.append(("Quote", truncated_quote()))
+
+    quote = generate()
+
+    # The cut-off line gets default hours and its totals are recalculated
+    downlight = quote.items[1]
+    assert downlight.hours_source == "default"
+    assert downlight.line_total == round(downlight.unit_material_cost * downlight.qty + downlight.labor_cost, 2)
+    assert quote.subtotal == round(sum(item.line_total for item in quote.items), 2)
+    assert stats.snapshot()["repaired_locally"] == 1
+
+
+def test_trailing_comma_is_repaired_locally(llm_script):
+    script, stats = llm_script
+    script.append(("Quote", json.dumps(QUOTE)[:-1] + ",}"))
+
+    quote = generate()
+
+    assert len(quote.items) == 2
+    assert stats.snapshot()["repaired_locally"] == 1
+
+
+def test_invalid_item_goes_through_item_repair(llm_script):
+    script, stats = llm_script
+    broken = {**QUOTE, "items": [GPO_ITEM, {"description": "Install LED downlight", "qty": "three"}]}
+    script.append(("Quote", broken))
+    script.append(("ItemRepair", {"items": [{**DOWNLIGHT_ITEM, "qty": 3}]}))
+
+    quote = generate()
+
+    assert [item.qty for item in quote.items] == [2, 3]
+    assert not script
+    assert stats.snapshot()["item_retry"] == 1
+
+
+def test_garbage_output_counts_as_failed(llm_script, monkeypatch):
+    script, stats = llm_script
+    monkeypatch.setattr(agent, "STRUCTURED_OUTPUT", False)
+    script.append((None, "Sorry, I can't help with that."))
+
+    with pytest.raises(QuoteParseError):
+        generate()
+    assert stats.snapshot()["failed"] == 1
+
+
+def test_empty_items_after_repair_counts_as_failed(llm_script, monkeypatch):
+    script, stats = llm_script
+    monkeypatch.setattr(agent, "STRUCTURED_OUTPUT", False)
+    script.append((None, '{"customer_name": "Bob", "job_summary": "GPOs", "items": ['))
+
+    with pytest.raises(QuoteParseError):
+        generate()
+    snapshot = stats.snapshot()
+    assert snapshot["failed"] == 1
+    assert snapshot["repaired_locally"] == 0
+
+
+def test_empty_items_tool_call_counts_as_failed(llm_script):
+    script, stats = llm_script
+    script.append(("Quote", {**QUOTE, "items": []}))
+
+    with pytest.raises(QuoteParseError):
+        generate()
+    assert stats.snapshot()["failed"] == 1
+
+
+@pytest.mark.parametrize("text, description", [
+    ('{"a": [1, 2, ], "items": [{"description": "x", "qty": 1}, {"description": "zzzz", "unit_material_cost": 1e', "zzzz"),
+    ('{"a": [1,   2,   ], "items": [{"description": "x"}, {"description": "abc", "qty": 1.', "abc"),
+])
+def test_repair_json_cuts_at_commas_after_dropped_characters(text, description):
+    # Trailing commas and whitespace dropped earlier must not shift later cut points
+    assert repair_json(text)["items"][1] == {"description": description}
+
+
+def test_server_owned_fields_are_not_taken_from_the_llm(llm_script):
+    script, stats = llm_script
+    script.append(("Quote", {
+        **QUOTE, "catalog_version": 999, "items": [{**GPO_ITEM, "hours_source": "bogus"}, DOWNLIGHT_ITEM]
+    }))
+
+    quote = generate()
+
+    assert quote.catalog_version != 999
+    assert [item.hours_source for item in quote.items] == ["llm", "llm"]
+    assert stats.snapshot()["clean"] == 1
@@ -0,0 +1,58 @@
+"""
+Semantic retrieval tests: recall of hybrid search against keyword search,
+and index file pruning racing other workers
+"""
+import os
+
+import semantic
+from materials import get_catalog, search_materials
+from semantic import hybrid_search
+
+
+# Query -> the SKU a quote for it needs
+LABELLED_QUERIES = {
+    "power outlet over the bench": "CL-GPO-10A",
+    "smoke alarm in the hallway": "SD-240V",
+    "exhaust fan": "FAN-CL",
+    "powerpoint in the garage": "CL-GPO-10A",
+    "6 downlites in the lounge": "LED-DL-10W",
+    "isolater for the pool pump": "ISO-POOL",
+    "cabling to the shed": "CAB-2.5-TE",
+}
+
+
+def recall_at(results_for, k: int = 5) -> float:
+    found = sum(sku in [m["sku"] for m in results_for(query)[:k]] for query, sku in LABELLED_QUERIES.items())
+    return found / len(LABELLED_QUERIES)
+
+
+def test_hybrid_search_recalls_more_than_keyword_search():
+    catalog = get_catalog()
+
+    keyword = recall_at(lambda query: search_materials(query, catalog))
+    hybrid = recall_at(lambda query: hybrid_search(query, catalog))
+
+    assert hybrid == 1.0
+    assert keyword < hybrid
+
+
+def test_prune_tolerates_files_removed_by_other_workers(tmp_path, monkeypatch):
+    monkeypatch.setattr(semantic, "INDEX_DIR", str(tmp_path))
+    for i in range(semantic.KEEP_INDEX_FILES + 3):
+        path = tmp_path / f"catalog-{i}-d512.f32"
+        path.write_bytes(b"")
+        os.utime(path, (i, i))
+
+    # Another worker deletes a file between listdir and getmtime
+    real_getmtime = os.path.getmtime
+
+    def racing_getmtime(path):
+        if path.endswith("catalog-0-d512.f32"):
+            os.remove(path)
+        return real_getmtime(path)
+
+    monkeypatch.setattr(os.path, "getmtime", racing_getmtime)
+    semantic._prune_index_files()
+
+    remaining = sorted(path.name for path in tmp_path.iterdir())
+    assert remaining == [f"catalog-{i}-d512.f32" for i in range(3, semantic.KEEP_INDEX_FILES + 3)]
@@ -0,0 +1,62 @@
+"""
+Shared cache tests: the running size total, LRU eviction and batched
+last-access refreshes
+"""
+import threading
+
+import pytest
+
+import shared_cache
+from shared_cache import SharedCache
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    """A SharedCache on a fresh database, with connections reopened for it."""
+    monkeypatch.setattr(shared_cache, "SHARED_CACHE_DB", str(tmp_path / "cache.db"))
+    monkeypatch.setattr(shared_cache, "_initialized", False)
+    monkeypatch.setattr(shared_cache, "_local", threading.local())
+    return SharedCache(max_bytes=1000)
+
+
+def stored_bytes() -> tuple[int, int]:
+    """(running total, actual total) of stored value sizes."""
+    conn = shared_cache._connect()
+    running = conn.execute("SELECT value FROM cache_meta WHERE name = 'bytes'").fetchone()[0]
+    actual = conn.execute("SELECT COALESCE(SUM(size), 0) FROM cache").fetchone()[0]
+    return running, actual
+
+
+def test_running_total_tracks_puts_replaces_and_evictions(cache):
+    for i in range(8):
+        cache.put("pdf", f"q{i}", b"x" * 300)
+    cache.put("pdf", "q7", b"x" * 100)
+
+    running, actual = stored_bytes()
+    assert running == actual <= cache.max_bytes
+    assert cache.get("pdf", "q7") == b"x" * 100
+    assert cache.get("pdf", "q0") is None
+
+
+def test_expired_entries_leave_the_total(cache, monkeypatch):
+    cache.put("quote", "old", b"x" * 200, ttl=10)
+    now = shared_cache.time.time()
+    monkeypatch.setattr(shared_cache.time, "time", lambda: now + 60)
+
+    assert cache.get("quote", "old") is None
+    assert stored_bytes() == (0, 0)
+
+
+def test_hits_refresh_lru_order_in_batches(cache, monkeypatch):
+    cache.put("pdf", "a", b"x" * 400)
+    cache.put("pdf", "b", b"x" * 400)
+    now = shared_cache.time.time()
+    monkeypatch.setattr(shared_cache.time, "time", lambda: now + shared_cache.TOUCH_INTERVAL + 1)
+
+    # A hit on the older entry is a read; its refresh is written with the stats
+    assert cache.get("pdf", "a") is not None
+    cache.flush_stats()
+    cache.put("pdf", "c", b"x" * 400)
+
+    assert cache.get("pdf", "a") is not None
+    assert cache.get("pdf", "b") is None